@@ -1,51 +1,284 @@
 #!/bin/env python
 
 import argparse
+import mmap
+import os
+from functools import lru_cache
+from typing import BinaryIO, Callable, Iterable, List, Optional, Tuple
+import numpy as np
 
-def group_consecutive(nums):
-    if not nums:
-        return []
+NEWLINE = ord("\n")
+ZERO = ord("0")
+WHITESPACE = np.frombuffer(b" \t\r\x0b\x0c", dtype=np.uint8)
+# ASCII digits of 00..99, to write two digits per step
+DIGIT_PAIRS = np.frombuffer(
+    "".join(f"{i:02d}" for i in range(100)).encode(), dtype=np.uint8
+).reshape(100, 2)
+BUFFERSIZE = 1048576  # 1Mb
+INT64_DIGITS = 18  # any number of up to 18 digits fits in an int64
+RUNS_PER_BATCH = 65536
+MINSCANCHUNK = 1048576  # numbers per parallel run scan chunk
+NUMBA_MINSIZE = 16 * MINSCANCHUNK  # below this, importing numba costs more than it saves
+
+def _find_runs_numpy(a: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return start and end arrays of the runs of consecutive numbers in sorted unique `a`."""
+    # a run ends wherever the next number is not the successor of the current one
+    breaks = np.flatnonzero(np.diff(a) != 1)
+    starts = a[np.r_[0, breaks + 1]]
+    ends = a[np.r_[breaks, a.size - 1]]
+    return starts, ends
+
+@lru_cache(maxsize=None)
+def _numba_find_breaks() -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    """
+    Import numba and compile (or load from numba's cache) the parallel run scan.
+    numba is imported lazily since its import alone takes ~0.1s; None is returned if it is not installed.
+    """
+    try:
+        from numba import get_num_threads, njit, prange
+    except ImportError:  # numba is optional: fall back to the numpy implementation
+        return None
+
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def _find_breaks(a, nchunks):
+        """
+        Return the indices in sorted unique `a` where a new run starts (excluding 0).
+        The array is scanned in `nchunks` chunks in parallel: a break only depends on two
+        neighbouring values, so chunks are independent and their breaks are simply concatenated.
+        """
+        n = a.shape[0]
+        chunksize = (n + nchunks - 1) // nchunks
+        counts = np.zeros(nchunks, np.int64)
+        for c in prange(nchunks):
+            for i in range(max(c * chunksize, 1), min((c + 1) * chunksize, n)):
+                counts[c] += a[i] != a[i - 1] + 1
+        offsets = np.cumsum(counts) - counts
+        breaks = np.empty(offsets[-1] + counts[-1], np.int64)
+        for c in prange(nchunks):
+            k = offsets[c]
+            for i in range(max(c * chunksize, 1), min((c + 1) * chunksize, n)):
+                # only store real breaks: slots past this chunk's last break belong to the next chunk
+                if a[i] != a[i - 1] + 1:
+                    breaks[k] = i
+                    k += 1
+        return breaks
 
-    nums = sorted(set(nums))
-    result = []
-    start = end = nums[0]
+    return lambda a: _find_breaks(a, max(min(get_num_threads(), a.size // MINSCANCHUNK), 1))
 
-    for n in nums[1:]:
-        if n == end + 1:
-            end = n
+def _find_runs(a: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return start and end arrays of the runs of consecutive numbers in sorted unique `a`."""
+    find_breaks = _numba_find_breaks() if a.size >= NUMBA_MINSIZE else None
+    if find_breaks is None:
+        return _find_runs_numpy(a)
+    breaks = find_breaks(a)
+    starts = a[np.r_[0, breaks]]
+    ends = a[np.r_[breaks - 1, a.size - 1]]
+    return starts, ends
+
+def sorted_unique(nums: Iterable[int], presorted: bool = False, unique: bool = False) -> np.ndarray:
+    """
+    Return the numbers as a sorted int64 array without duplicates.
+    With presorted=True the input is assumed to be sorted already and only duplicates are removed;
+    with unique=True as well the input is assumed to have no duplicates and is returned as is.
+    """
+    a = np.asarray(nums, dtype=np.int64)
+    if a.size == 0:
+        return a
+    if not presorted:
+        lowest = a.min()
+        if int(a.max()) - int(lowest) < 2**32:
+            # sorting 32 bit keys is about twice as fast: shift the values to start from 0
+            a = np.sort((a - lowest).astype(np.uint32)).astype(np.int64) + lowest
         else:
-            result.append(f"{start}-{end}" if start != end else f"{start}")
-            start = end = n
+            a = np.sort(a)
+    elif unique:
+        return a
+    return a[np.r_[True, a[1:] != a[:-1]]]
 
-    result.append(f"{start}-{end}" if start != end else f"{start}")
-    return result
+def group_consecutive_runs(
+    nums: Iterable[int], presorted: bool = False, unique: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the runs of consecutive numbers in `nums` as two int64 arrays of run starts and run ends.
+    Callers that need the numeric boundaries should use this rather than group_consecutive,
+    whose formatted strings would have to be parsed back; format_runs turns the arrays into text.
+    """
+    a = sorted_unique(nums, presorted=presorted, unique=unique)
+    if a.size == 0:
+        return a, a
+    return _find_runs(a)
 
-def main():
-    parser = argparse.ArgumentParser(description="Group consecutive numbers into ranges.")
-    parser.add_argument("--input", "-i", required=True, help="Path to input file containing numbers (one per line)")
-    parser.add_argument("--output", "-o", required=False, help="Path to output file to write grouped ranges (optional). If not provided, prints to screen")
+def format_runs(starts: np.ndarray, ends: np.ndarray) -> bytes:
+    """
+    Format runs as ASCII bytes: comma separated, "start-end" for ranges and "start" for single numbers.
+    All digits are written into one uint8 buffer with vectorized operations.
+    """
+    if starts.size == 0:
+        return b""
+    ranged = starts != ends
+    tokens_per_run = 1 + ranged
+    first_token = np.cumsum(tokens_per_run) - tokens_per_run
 
-    args = parser.parse_args()
+    # numbers to print in order, each followed by a separator
+    values = np.empty(first_token[-1] + tokens_per_run[-1], dtype=np.int64)
+    values[first_token] = starts
+    values[first_token[ranged] + 1] = ends[ranged]
+    separators = np.full(values.size, ord(","), dtype=np.uint8)
+    separators[first_token[ranged]] = ord("-")
+
+    negative = values < 0
+    magnitudes = np.abs(values)
+    ndigits = np.ones(values.size, dtype=np.int64)
+    power = 10
+    while power <= magnitudes.max():
+        ndigits += magnitudes >= power
+        power *= 10
+
+    separator_pos = np.cumsum(ndigits + negative + 1) - 1
+    out = np.empty(separator_pos[-1] + 1, dtype=np.uint8)
+    out[separator_pos] = separators
+    out[(separator_pos - ndigits - 1)[negative]] = ord("-")
+    # fill digits from the least significant ones, right to left, two at a time from a lookup table
+    digit_pos = separator_pos - 1
+    for d in range(0, ndigits.max(), 2):
+        pairs = ndigits - d >= 2
+        pair_values = magnitudes[pairs] % 100
+        out[digit_pos[pairs]] = DIGIT_PAIRS[pair_values, 1]
+        out[digit_pos[pairs] - 1] = DIGIT_PAIRS[pair_values, 0]
+        single = ndigits - d == 1
+        out[digit_pos[single]] = magnitudes[single] % 10 + ZERO
+        magnitudes //= 100
+        digit_pos -= 2
+    return out[:-1].tobytes()  # drop the trailing separator
+
+def write_runs(
+    outfile: BinaryIO, starts: np.ndarray, ends: np.ndarray, batchsize: int = RUNS_PER_BATCH
+) -> None:
+    """
+    Write the runs formatted as in format_runs to the binary file handle `outfile`,
+    formatting `batchsize` runs at a time so the whole output string is never held in memory.
+    """
+    for i in range(0, starts.size, batchsize):
+        if i:
+            outfile.write(b",")
+        outfile.write(format_runs(starts[i : i + batchsize], ends[i : i + batchsize]))
+
+def group_consecutive(nums: Iterable[int], presorted: bool = False, unique: bool = False) -> List[str]:
+    """Return the runs of consecutive numbers in `nums` as strings: "start-end" for ranges, "start" for single numbers."""
+    starts, ends = group_consecutive_runs(nums, presorted=presorted, unique=unique)
+    if starts.size == 0:
+        return []
+    return format_runs(starts, ends).decode().split(",")
+
+def _parse_digit_lines(b: np.ndarray) -> np.ndarray:
+    """
+    Parse a uint8 array of newline separated lines into an int64 array, one number per line.
+    Lines are kept only if, once surrounding whitespace is stripped, they are non-empty and made of digits.
+    Raises ValueError for numbers too large for an int64.
+    """
+    is_newline = b == NEWLINE
+    is_digit = (b >= ZERO) & (b <= ZERO + 9)
+    digit_pos = np.flatnonzero(is_digit)
+    if digit_pos.size == 0:
+        return np.empty(0, dtype=np.int64)
+    line_ids = np.cumsum(is_newline)  # line index of every byte
+    line_of_digit = line_ids[digit_pos]
 
+    # group the digits by line: first and last digit position and digit count of each line
+    group_starts = np.flatnonzero(np.r_[True, line_of_digit[1:] != line_of_digit[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, digit_pos.size])
+    first_digit = digit_pos[group_starts]
+    last_digit = digit_pos[group_starts + group_sizes - 1]
+
+    # a line is valid if its digits are contiguous and it holds nothing else but whitespace
+    valid = last_digit - first_digit + 1 == group_sizes
+    invalid_bytes = np.flatnonzero(~(is_digit | is_newline | np.isin(b, WHITESPACE)))
+    if invalid_bytes.size:
+        valid &= ~np.isin(line_of_digit[group_starts], line_ids[invalid_bytes])
+
+    # each digit is worth its value times 10 to the power of its distance from the end of the number
+    powers = np.repeat(last_digit, group_sizes) - digit_pos
+    values = (b[digit_pos] - ZERO).astype(np.int64) * np.power(10, powers, dtype=np.int64)
+    numbers = np.add.reduceat(values, group_starts)
+    # longer numbers overflow above: parse them exactly and reject those that do not fit in an int64
+    for g in np.flatnonzero(valid & (group_sizes > INT64_DIGITS)):
+        number = int(b[first_digit[g] : last_digit[g] + 1].tobytes())
+        if number > np.iinfo(np.int64).max:
+            raise ValueError(f"number {number} is too large: numbers up to {np.iinfo(np.int64).max} are supported")
+        numbers[g] = number
+    return numbers[valid]
+
+def read_numbers(path: str, blocksize: int = BUFFERSIZE) -> np.ndarray:
+    """
+    Read non-negative integers (one per line) into an int64 array.
+    Blank lines and lines that are not plain digits are skipped; numbers above the int64 range raise ValueError.
+    The file is memory mapped and parsed in blocks of about `blocksize` bytes ending at a newline,
+    so temporary arrays stay small whatever the size of the input.
+    """
+    with open(path, "rb") as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return np.empty(0, dtype=np.int64)
+        # the mapping is released when it goes out of scope (no numpy view of it must survive)
+        mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    size = len(mm)
+
+    # there cannot be more numbers than lines: size the result once and fill it block by block
+    lines_count = 1 + sum(mm[i : i + blocksize].count(b"\n") for i in range(0, size, blocksize))
+    nums = np.empty(lines_count, dtype=np.int64)
+    nums_count = 0
+
+    start = 0
+    while start < size:
+        end = min(start + blocksize, size)
+        if end < size:
+            # stop the block after its last newline (or extend it up to the next one)
+            end = mm.rfind(b"\n", start, end) + 1 or mm.find(b"\n", end) + 1 or size
+        b = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+        block_nums = _parse_digit_lines(b)
+        nums[nums_count : nums_count + block_nums.size] = block_nums
+        nums_count += block_nums.size
+        start = end
+    return nums[:nums_count]
+
+def run(input_path: str, output_path: Optional[str] = None, assume_sorted_unique: bool = False) -> None:
+    """
+    Group the numbers of `input_path` into ranges and write them to `output_path`,
+    or print them to screen if no output path is given.
+    This is the single codepath for every entry point: wrappers only need to parse their arguments and call it.
+    """
     # Read numbers from input file
-    with open(args.input, "r") as infile:
-        nums = [int(line.strip()) for line in infile if line.strip().isdigit()]
+    nums = read_numbers(input_path)
+    if assume_sorted_unique and not np.all(nums[1:] > nums[:-1]):
+        raise ValueError(f"numbers in {input_path} are not sorted and unique: run without --assume-sorted-unique")
 
     # Group numbers and write to output file
-    grouped = group_consecutive(nums)
-    output_str = ",".join(grouped)
+    starts, ends = group_consecutive_runs(
+        nums, presorted=assume_sorted_unique, unique=assume_sorted_unique
+    )
 
-    if args.output:
-        with open(args.output, "w") as outfile:
-            outfile.write(output_str)
-        print(f"Grouped ranges written to {args.output}")
+    if output_path:
+        with open(output_path, "wb", buffering=BUFFERSIZE) as outfile:
+            write_runs(outfile, starts, ends)
+        print(f"Grouped ranges written to {output_path}")
     else:
         # Print to screen with standout formatting
         print("\n" + "="*40)
         print("Grouped Ranges:")
-        print(output_str)
+        print(format_runs(starts, ends).decode())
         print("="*40 + "\n")
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Group consecutive numbers into ranges.")
+    parser.add_argument("--input", "-i", required=True, help="Path to input file containing numbers (one per line)")
+    parser.add_argument("--output", "-o", required=False, help="Path to output file to write grouped ranges (optional). If not provided, prints to screen")
+    parser.add_argument("--assume-sorted-unique", "-s", action="store_true", help="Input numbers are already sorted and without duplicates: skip sorting and deduplication")
+
+    args = parser.parse_args()
+
+    try:
+        run(args.input, args.output, assume_sorted_unique=args.assume_sorted_unique)
+    except ValueError as e:
+        parser.error(str(e))
+
 if __name__ == "__main__":
     main()
-
@@ -11,34 +11,91 @@
 # Tue 12 Nov 2024 17:39:07 GMT 2.3 added timeout and retries for file locking
 # Wed 13 Nov 2024 11:56:31 GMT 2.4 added possibility to work in batches but single-thread
 # Sat 30 Nov 2024 16:02:39 GMT 2.5 added progress bar
+# Thu 15 Oct 2026 01:32:56 GMT 2.6 label_proteins works on blocks of lines
+# Thu 15 Oct 2026 01:41:10 GMT 2.7 added 'scan' read method for fasta headers
+# Thu 15 Oct 2026 01:55:32 GMT 2.8 added 'grep' read method for fasta headers
+# Thu 15 Oct 2026 02:10:47 GMT 2.9 tqdm imported only when --progress is given
+# Thu 15 Oct 2026 02:24:05 GMT 3.0 file locks acquired with exponential backoff and jitter
+# Thu 15 Oct 2026 02:37:19 GMT 3.1 re_label_proteins works on blocks of lines
+# Thu 15 Oct 2026 02:52:40 GMT 3.2 sequential approach reads fasta files in parallel with --threads
+# Thu 15 Oct 2026 03:05:12 GMT 3.3 removed 'chunks' read method, 'lines' reads binary
+# Thu 15 Oct 2026 03:14:58 GMT 3.4 clone_file copies with shutil.copyfile
+# Thu 15 Oct 2026 03:31:26 GMT 3.5 added 'prefetch' read method with concurrent file reads
+# Thu 15 Oct 2026 03:44:03 GMT 3.6 page cache hints with posix_fadvise
+# Thu 15 Oct 2026 03:58:36 GMT 3.7 added --hash-keys to store 64 bit fingerprints instead of protein ids
+# Thu 15 Oct 2026 04:27:51 GMT 3.8 added --streamed approach: one pass over the input file sorted by protein id
+# Thu 15 Oct 2026 04:39:14 GMT 3.9 fasta files listed with os.scandir
+# Thu 15 Oct 2026 04:48:30 GMT 4.0 split positions found in binary mode with bytes.find
+# Thu 15 Oct 2026 05:06:42 GMT 4.1 parallel map merged by partitions of protein ids
+# Thu 15 Oct 2026 05:15:08 GMT 4.2 nochunks workers tell re_label_proteins if their file is already labelled
+# Thu 15 Oct 2026 05:34:47 GMT 4.3 added --awk to label with an awk process in the sequential approach
+# Thu 15 Oct 2026 05:46:20 GMT 4.4 proteome ids and joined labels interned
+# Thu 15 Oct 2026 05:55:02 GMT 4.5 per-line splits with slicing and maxsplit
+# Thu 15 Oct 2026 06:03:37 GMT 4.6 proteome ids cut from file names with a single slice
+# Thu 15 Oct 2026 06:21:15 GMT 4.7 combine_output_chunks works on blocks of lines
+# Thu 15 Oct 2026 06:48:09 GMT 4.8 workers skip busy chunks and come back to them later
+# Thu 15 Oct 2026 07:02:44 GMT 4.9 no file locks when a single worker labels all chunks
+# Thu 15 Oct 2026 07:31:18 GMT 5.0 added --scatter approach: input and maps partitioned by protein id
+# Thu 15 Oct 2026 07:44:52 GMT 5.1 combine_output_files works on blocks of lines
+# Thu 15 Oct 2026 07:52:06 GMT 5.2 sorted labels cached
+# Thu 15 Oct 2026 08:13:40 GMT 5.3 file locks with fcntl.flock instead of filelock
+# Thu 15 Oct 2026 08:26:57 GMT 5.4 labels sorted once per distinct label in each block
+# Thu 15 Oct 2026 08:35:21 GMT 5.5 worker ids assigned by the pool initializer
+# Thu 15 Oct 2026 08:44:09 GMT 5.6 temporary files deleted with one unlink each, concurrently if many
+# Thu 15 Oct 2026 08:58:33 GMT 5.7 key function resolved once per worker
 
 # imports
 import os
 import sys
 import re
 import time
-from tqdm import tqdm
 import shutil
+import subprocess
 import argparse
-from glob import glob
+import pickle
 from typing import List, Optional
+from itertools import accumulate, compress, count, groupby, islice, repeat
+from functools import lru_cache, partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from heapq import merge
+from zlib import crc32
+from operator import ne, or_
 
 
 # for distributed/batch approach only:
 from random import sample, randint
-from multiprocessing import Pool, current_process, cpu_count
-from filelock import Timeout, FileLock
+from multiprocessing import Pool, Value, cpu_count
+import fcntl
+import signal
 from math import ceil
 
 # for profiling/testing only:
 # from pympler import asizeof
 
 # constants
-READMETHOD = "lines"
+READMETHOD = "grep"
+GREPBATCH = 1000  # max number of fasta files per grep call
+IODEPTH = 64  # max number of fasta files being read at the same time by 'prefetch'
 HEADER = "cluster_id\tprotein_id\tproteomes\tis_rep\n"
 BUFFERSIZE = 1048576  # 1Mb
 MINCHUNKSIZE = "5m"  # 5 Mb
+SIPREFIXES = {"k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4, "p": 1024**5}
+SORTMEMORY = "2G"  # main memory buffer for each external sort (--streamed)
 RE_REMOVE_EXTENSION = re.compile(r"\.[^.]+$")
+# awk program for --awk: load the map (first file), then label the input file (second file)
+AWK_LABEL_PROGRAM = r"""
+BEGIN { FS = OFS = "\t"; nolabel = ENVIRON["NOLABEL"]; out = ENVIRON["OUTFILE"] }
+FILENAME == ARGV[1] { m[$1] = $2; next }
+NF != 2 { print "ERROR: unexpected format at line " FNR ": expected two columns" > "/dev/stderr"; exit 2 }
+{
+    if (FNR == 1 || $1 != prev) { c++; rep = "*" } else { rep = "" }
+    prev = $1
+    printf "%.0f\t%s\t%s\t%s\n", c - 1, $2, (($2 in m) ? m[$2] : nolabel), rep >> out
+}
+END { printf "%.0f\n", c }
+"""
 DESCRIPTION = """
 Script to label the second column of a tsv file, assumed to contain protein id from fasta headers,
 with the name of the fasta file(s) where the proteins are located.
@@ -68,6 +125,9 @@ Sample output file:
 Example call:
     ./label_clusters.py --fasta_dir pig/ --input_file results_pig/Specie_protein_cluster.tsv --out_file results_pig/Labelled_Specie_protein_cluster.tsv --prefix proteome_ --extension .fa
 
+    Without --batchsize, --threads can still be used: the fasta files will be read in parallel
+    by that many workers and their partial dictionaries merged before labelling the input file.
+
 Distributed approach (batch tagging, optionally parallel):
       When dealing with a huge amount of entries memory requirements could be a problem.
       The labelling work could then be performed in batches, specifying a --batchsize. That will be the
@@ -89,18 +149,36 @@ Distributed approach (batch tagging, optionally parallel):
       This approach eliminates the chance of time spent with workers trying to acquire file lock on
       the same chunk, but it uses more disk space and could suffer i/o performance loss when combining
       result files in the end.
+
+      Streamed approach: specify --streamed together with --batchsize. Instead of annotating the input
+      file once per batch, the input file is sorted by protein id (with an external sort), each batch
+      writes its partial dictionary sorted by protein id to disk, and all of them are merged with the
+      input in a single pass; the original order is then restored with a second sort.
+      This needs temporary disk space of about twice the size of the input file.
+
+      Scatter approach: specify --scatter together with --batchsize. The input file is scattered by
+      protein id into as many partitions as there are batches (or threads, if more), and each batch
+      writes its partial dictionary to disk split in the same partitions. Each partition of the input
+      is then labelled in a single pass by one worker, holding only the matching partition of the map
+      merged from all batches (about the size of the dictionary of one batch); the original order is
+      restored with a merge by line number. No external sort is needed.
+      This needs temporary disk space of about three times the size of the input file.
 """
 
 # timing tests
 #    on a node in a linux datacentre:
 #        1s to process 13 files of approx 30M each for a total of 627957 ids
-#          'chunks': ~800000 ids/s
+#          'chunks': ~800000 ids/s (method since removed)
 #          'full': ~770000 ids/s
 #          'lines': ~1100000 ids/s
 #        (on macos 'full' was as fast as 'lines' and 'chunks' slightly less)
 #        1h30m to process ~120k files of approx 1.4Mb each for a total of 591 million ids
 #          'full': ~125000 ids/s
 #          'lines': ~110000 ids/s
+#        'scan' vs 'lines' on files with 5 sequence lines per header: ~25% faster
+#        'grep' vs 'scan' on the same files: ~35% faster
+#        writing output blocks (_write_clusters_block), 200k lines: one f-string per line joined
+#          and encoded once is ~10% faster than bytes lines with a cluster id table or b"%d" formatting
 #
 # memory tests
 #        55.82GiB to process ~120k files of approx 1.4Mb each for a total of 591 million ids sequentially
@@ -181,45 +259,262 @@ def eprint(*myargs, **kwargs):
     print(*myargs, file=sys.stderr, **kwargs)
 
 
-def read_file_in_chunks(file_path, chunk_size=BUFFERSIZE):
+def advise_sequential(fh, willneed=False):
+    """
+    Hints the kernel that an open file will be read sequentially, so that it uses a larger readahead window.
+    Optionally also asks to start reading the whole file into the page cache right away.
+    Does nothing where posix_fadvise is not available.
+
+    Args:
+        fh (file object): The open file.
+        willneed (bool, optional): Whether to also prefetch the whole file. Default is False.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if willneed:
+            os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass  # e.g. a pipe
+
+
+def advise_done(fh):
+    """
+    Hints the kernel that the pages of an open file will not be needed again, so that reading many
+    fasta files once does not evict more useful data (e.g. the input file) from the page cache.
+    Does nothing where posix_fadvise is not available.
+
+    Args:
+        fh (file object): The open file.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+
+def _read_bytes(file_path):
+    """
+    return the whole content of a file as bytes, then drop it from the page cache
+    """
+    with open(file_path, "rb") as fh:
+        advise_sequential(fh, willneed=True)
+        data = fh.read()
+        advise_done(fh)
+    return data
+
+
+def scan_fasta_headers(file_path, data=None):
+    """
+    Reads a fasta file and yields the identifiers found in its headers (the text after '>' up to the first space).
+    Instead of going through every line, it jumps from one header to the next with bytes.find,
+    which runs at memchr speed, so no string is ever built for sequence lines.
+
+    Args:
+        file_path (str): Path to the fasta file.
+        data (bytes, optional): The content of the file, if already read. Default is None.
+
+    Yields:
+        str: The identifier of each fasta header, in file order.
+
+    Example:
+        for protein_id in scan_fasta_headers("proteome_1.fa"):
+            print(protein_id)
+    """
+    if data is None:
+        data = _read_bytes(file_path)
+
+    if data.startswith(b">"):
+        pos = 0
+    else:
+        pos = data.find(b"\n>") + 1  # position of the first '>'
+        if pos == 0:
+            return  # no headers
+
+    while True:
+        end = data.find(b"\n", pos)
+        if end == -1:
+            end = len(data)  # header on the last line, without newline
+        line_end = end - 1 if data[end - 1 : end] == b"\r" else end  # CRLF line ending
+        space = data.find(b" ", pos, line_end)
+        yield data[pos + 1 : line_end if space == -1 else space].decode()
+        pos = data.find(b"\n>", end) + 1
+        if pos == 0:
+            break
+
+
+def prefetch_files(file_paths, depth=IODEPTH):
+    """
+    Reads whole files with a pool of threads, keeping up to `depth` reads in flight,
+    so that the latency of opening and reading many small files is overlapped
+    (file reads release the GIL).
+
+    Args:
+        file_paths (list): List of paths to the files.
+        depth (int): Max number of files being read at the same time (default: IODEPTH).
+
+    Yields:
+        tuple: (file_path, data) for each file, in the same order as file_paths.
+
+    Example:
+        for file_path, data in prefetch_files(fasta_files):
+            print(file_path, len(data))
+    """
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        in_flight = deque()
+        for file_path in file_paths:
+            if len(in_flight) == depth:
+                done_path, future = in_flight.popleft()
+                yield done_path, future.result()
+            in_flight.append((file_path, executor.submit(_read_bytes, file_path)))
+        while in_flight:
+            done_path, future = in_flight.popleft()
+            yield done_path, future.result()
+
+
+def grep_fasta_headers(fasta_files, batch_size=GREPBATCH):
     """
-    Reads a file in chunks and yields only complete lines to avoid splitting lines across chunks.
+    Yields the identifiers found in the headers of the given fasta files, together with their file,
+    using an external `grep` process (run on batches of files) to find the header lines:
+    grep skips sequence lines much faster than Python and runs alongside the parsing of its output.
 
     Args:
-        file_path (str): Path to the file.
-        chunk_size (int): Number of bytes to read per chunk (default: BUFFERSIZE).
+        fasta_files (list): List of paths to the fasta files.
+        batch_size (int): Maximum number of files passed to each grep call (default: GREPBATCH).
 
     Yields:
-        str: Full lines from the file, stripped of newline characters.
+        tuple: (file_path, protein_id) for every fasta header, in file order.
+
+    Raises:
+        RuntimeError: If grep fails (exit status other than 0 or 1) or its output has no filename separator.
+    """
+    env = dict(os.environ, LC_ALL="C")  # byte matching, no locale overhead
+    for i in range(0, len(fasta_files), batch_size):
+        batch = fasta_files[i : i + batch_size]
+        # -H: always print the filename, --null: terminate the filename with a NUL byte
+        # (not -Z, which means decompress in BSD grep), -a: print matching lines even if
+        # a file looks binary (has NUL bytes), instead of a "Binary file ... matches" message
+        proc = subprocess.Popen(
+            ["grep", "-a", "-H", "--null", "^>", "--"] + batch,
+            stdout=subprocess.PIPE,
+            bufsize=BUFFERSIZE,
+            env=env,
+        )
+        current_file, current_path = None, None
+        for line in proc.stdout:
+            file, nul, header = line.partition(b"\0")
+            if not nul:  # never guess where the filename ends
+                proc.kill()
+                proc.wait()
+                raise RuntimeError(f"unexpected grep output, no NUL after the filename: {line!r}")
+            if file != current_file:
+                current_file, current_path = file, os.fsdecode(file)
+            yield current_path, header[1:].rstrip(b"\r\n").split(b" ", 1)[0].decode()
+        if proc.wait() > 1:  # 1 only means no header found
+            raise RuntimeError(f"grep failed with exit status {proc.returncode}")
+
+
+def read_line_blocks(fh, block_size=BUFFERSIZE):
+    """
+    Reads an open text file in blocks of about `block_size` characters, each made of complete lines.
+
+    Args:
+        fh (file object): The text file handle to read from.
+        block_size (int): Number of characters to read per block (default: BUFFERSIZE).
+
+    Yields:
+        str: Blocks of one or more full lines, each block ending with a newline character.
 
     Example:
-        for line in read_file_in_chunks("file.txt", chunk_size=1024):
-            print(line)
+        with open("file.txt") as fh:
+            for block in read_line_blocks(fh):
+                lines = block.splitlines()
+    """
+    remainder = ""
+    while True:
+        chunk = fh.read(block_size)
+        if not chunk:
+            break  # end of file
+
+        chunk = remainder + chunk
+        cut = chunk.rfind("\n") + 1
+        # keep the possibly incomplete last line for the next block
+        remainder = chunk[cut:]
+        if cut:
+            yield chunk[:cut]
+
+    if remainder:
+        yield remainder + "\n"
+
+
+@lru_cache(maxsize=None)
+def _columns_pattern(columns):
+    """
+    return the compiled regex matching lines of `columns` tab separated columns
+    (possessive quantifiers: fields cannot contain tabs or newlines, so there is nothing to backtrack)
+    """
+    return re.compile(r"(?:[^\t\n]*+" + r"\t[^\t\n]*+" * (columns - 1) + r"\n)*+")
+
+
+def _has_columns(block, columns):
+    """
+    Checks that every line of a block of lines has exactly `columns` tab separated columns.
+    The whole block is matched in one call; comparing only the total number of fields in the block
+    would let a short line and a long line make up for each other, and shift all the following fields.
+
+    Args:
+        block (str): One or more full lines, each ending with a newline character.
+        columns (int): The expected number of columns.
+
+    Returns:
+        bool: True if all lines have `columns` columns.
     """
-    with open(file_path, "r") as fh:
-        buffer = ""
-        while True:
-            chunk = fh.read(chunk_size)
-            if not chunk:
-                break  # end of file
+    return _columns_pattern(columns).fullmatch(block) is not None
 
-            buffer += chunk
-            lines = buffer.splitlines(True)
 
-            # process all lines except the last one which may be incomplete
-            for line in lines[:-1]:
-                yield line.strip()
+def list_fasta_files(fasta_dir, prefix="", extension=""):
+    """
+    Lists the files in a directory whose names start with prefix and end with extension,
+    skipping hidden files (like the glob pattern prefix*extension would).
+    os.scandir gets the file type together with the names, so no extra stat call is needed per file.
+
+    Args:
+        fasta_dir (str): The directory to search.
+        prefix (str, optional): Required start of the file names. Default is "".
+        extension (str, optional): Required end of the file names. Default is "".
+
+    Returns:
+        list: Paths of the matching files, in directory order.
+    """
+    with os.scandir(fasta_dir) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.name.startswith(prefix)
+            and entry.name.endswith(extension)
+            and not entry.name.startswith(".")
+            and entry.is_file()
+        ]
 
-            # keep the remaining possibly incomplete line in the buffer
-            buffer = lines[-1]
 
-        if buffer:
-            yield buffer.strip()
+def _delete_file(filename):
+    """
+    delete a file with a single unlink call, if it exists
+    """
+    try:
+        os.remove(filename)
+    except (FileNotFoundError, IsADirectoryError):
+        pass
 
 
 def delete_files(filenames: List[str], path: Optional[str] = None):
     """
-    Deletes specified temporary files.
+    Deletes specified temporary files, skipping the ones that do not exist.
+    Many files are deleted by up to IODEPTH threads at the same time: on network file systems
+    every unlink waits for a round trip to the server.
 
     Args:
         filenames (List[str]): List of filenames to delete.
@@ -228,11 +523,15 @@ def delete_files(filenames: List[str], path: Optional[str] = None):
     Returns:
         None
     """
-    for filename in filenames:
-        if path is not None:
-            filename = os.path.join(path, filename)
-        if os.path.isfile(filename):
-            os.remove(filename)
+    if path is not None:
+        filenames = [os.path.join(path, filename) for filename in filenames]
+    if len(filenames) <= IODEPTH:
+        for filename in filenames:
+            _delete_file(filename)
+    else:
+        with ThreadPoolExecutor(max_workers=IODEPTH) as executor:
+            for _ in executor.map(_delete_file, filenames):
+                pass
 
 
 # functions
@@ -367,6 +666,38 @@ def check_args(DESCRIPTION):
         help="Show a progress bar",
         default=False,
     )
+    parser.add_argument(
+        "-m",
+        "--streamed",
+        action="store_true",
+        required=False,
+        help="Use the streamed approach (requires --batchsize): label the input file in a single pass merging sorted partial dictionaries instead of relabelling it for every batch",
+        default=False,
+    )
+    parser.add_argument(
+        "-x",
+        "--scatter",
+        action="store_true",
+        required=False,
+        help="Use the scatter approach (requires --batchsize): partition the input file and the partial dictionaries by protein id and label each partition in a single pass instead of relabelling the input file for every batch",
+        default=False,
+    )
+    parser.add_argument(
+        "-a",
+        "--awk",
+        action="store_true",
+        required=False,
+        help="In the sequential approach, label the input file with an awk process (mawk or gawk if available) instead of python; cannot be combined with --sortlabels, --uniq or --hash-keys",
+        default=False,
+    )
+    parser.add_argument(
+        "-k",
+        "--hash-keys",
+        action="store_true",
+        required=False,
+        help="Store 64 bit fingerprints of the protein ids instead of the ids themselves, roughly halving the memory used by the map (uses xxhash if installed); two different ids getting the same fingerprint is possible but extremely unlikely",
+        default=False,
+    )
     args = parser.parse_args()
     eprint(f" |-- input_file: {args.input_file}")
 
@@ -386,13 +717,12 @@ def check_args(DESCRIPTION):
     if not os.path.isdir(args.fasta_dir):
         exit_with_error(f"ERROR: No such directory '{args.fasta_dir}'", 2)
 
-    # check for files in fasta_dir
-    search_pattern = (
-        f"{args.prefix}*{args.extension}"
-        if args.extension and args.prefix
-        else f"*{args.extension or ''}"
+    # check for files in fasta_dir (prefix is only used together with extension)
+    fasta_files = list_fasta_files(
+        args.fasta_dir,
+        args.prefix if args.extension and args.prefix else "",
+        args.extension or "",
     )
-    fasta_files = glob(os.path.join(args.fasta_dir, search_pattern))
     if not fasta_files:
         exit_with_error(
             f"ERROR: No matching '{args.extension or ''}' files in '{args.fasta_dir}'.",
@@ -407,6 +737,40 @@ def check_args(DESCRIPTION):
     if args.batchsize:
         args.distributed = True
 
+    if args.streamed:
+        if not args.distributed:
+            exit_with_error(
+                "ERROR: --streamed requires distributed execution. Specify --batchsize and optionally --threads",
+                22,
+            )
+        if args.hash_keys:
+            exit_with_error(
+                "ERROR: --streamed cannot be used with --hash-keys: the partial dictionaries are sorted by protein id",
+                22,
+            )
+        if shutil.which("sort") is None:
+            exit_with_error("ERROR: --streamed requires the 'sort' command", 2)
+
+    if args.scatter:
+        if not args.distributed:
+            exit_with_error(
+                "ERROR: --scatter requires distributed execution. Specify --batchsize and optionally --threads",
+                22,
+            )
+        if args.streamed:
+            exit_with_error("ERROR: --scatter cannot be used with --streamed", 22)
+
+    if args.awk:
+        if args.distributed or args.sortlabels or args.uniq or args.hash_keys:
+            exit_with_error(
+                "ERROR: --awk only works in the sequential approach without --sortlabels, --uniq and --hash-keys",
+                22,
+            )
+        args.awk = shutil.which("mawk") or shutil.which("gawk") or shutil.which("awk")
+        if args.awk is None:
+            exit_with_error("ERROR: --awk requires an awk command", 2)
+        eprint(f" |-- awk: {args.awk}")
+
     # chunksize processing
     if args.chunksize and not args.distributed:
         exit_with_error(
@@ -428,74 +792,187 @@ def check_args(DESCRIPTION):
     if args.threads > cpu_count():
         args.threads = cpu_count()
         eprint(f" |-- WARNING: only {args.threads} threads available")
-    if args.distributed:
+    if args.hash_keys:
+        try:
+            import xxhash  # noqa: F401
+        except ImportError:
+            eprint(
+                f" |-- WARNING: xxhash not installed, --hash-keys will use the slower blake2b"
+            )
+    if args.streamed:
+        eprint(f" |-- threads: {args.threads}")
+        eprint(f" |-- batchsize: {args.batchsize} (streamed)")
+    elif args.scatter:
+        eprint(f" |-- threads: {args.threads}")
+        eprint(f" |-- batchsize: {args.batchsize} (scatter)")
+    elif args.distributed:
         eprint(f" |-- threads: {args.threads}")
         eprint(f" |-- batchsize: {args.batchsize}")
         if args.nochunks:
             eprint(f" |-- chunksize: 0 (input file won't be split)")
         else:
             eprint(f" |-- chunksize: {args.chunksize} bytes")
+    elif args.threads > 1:
+        eprint(f" |-- threads: {args.threads} (for reading fasta files)")
 
     return args, fasta_files
 
 
+def _blake2b_64(protein_id):
+    """
+    return a 64 bit integer fingerprint of a protein_id computed with blake2b
+    """
+    return int.from_bytes(
+        blake2b(protein_id.encode(), digest_size=8).digest(), "little"
+    )
+
+
+def get_key_function(args):
+    """
+    Returns the function used to turn protein_ids into map keys: None if protein_ids are used as they are,
+    otherwise a function returning a 64 bit integer fingerprint (xxh3 if xxhash is installed, else blake2b).
+
+    Args:
+        args (argparse.Namespace): Parsed arguments including the hash_keys option.
+
+    Returns:
+        function or None: The key function.
+    """
+    if not args.hash_keys:
+        return None
+    try:
+        from xxhash import xxh3_64_intdigest
+
+        return xxh3_64_intdigest
+    except ImportError:
+        return _blake2b_64
+
+
+def proteome_id_function(args):
+    """
+    Returns a function giving the proteome identifier for a fasta file: its basename without extension and prefix.
+    Prefix and extension lengths are computed once, so that each file name is cut with a single slice.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments including prefix and extension options.
+
+    Returns:
+        function: Takes the path to a fasta file (str) and returns the proteome identifier (str).
+
+    Example:
+        get_proteome_id = proteome_id_function(args)
+        proteome_id = get_proteome_id("fasta_dir/proteome_1.fa")
+    """
+    basename = os.path.basename
+    # optionally remove prefix from the filenames
+    prefix_len = len(args.prefix) if args.prefix is not None else 0
+
+    if args.extension is not None:
+        extension_len = len(args.extension)
+
+        def get_proteome_id(file):
+            name = basename(file)
+            return sys.intern(name[prefix_len : max(len(name) - extension_len, 0)])
+
+    else:  # remove extension, if any
+
+        def get_proteome_id(file):
+            return sys.intern(RE_REMOVE_EXTENSION.sub("", basename(file))[prefix_len:])
+
+    return get_proteome_id
+
+
 def create_proteome_protein_map(fasta_files, args, read_method=READMETHOD):
     """
     Creates a dictionary mapping protein identifiers (from fasta headers)
     to proteome identifiers (from file names) by reading through specified fasta files
-    in one of three methods: 'lines', 'full', or 'chunks'.
+    in one of five methods: 'grep', 'scan', 'prefetch', 'lines', or 'full'
+    ('grep' falls back to 'scan' if grep is not available;
+    'prefetch' is 'scan' with up to IODEPTH files read concurrently).
 
     Args:
         fasta_files (list): List of paths to the fasta files.
         args (argparse.Namespace): Parsed arguments including prefix and extension options.
-        read_method (str): Method to read files; options are 'lines', 'full', and 'chunks'.
+        read_method (str): Method to read files; options are 'grep', 'scan', 'prefetch', 'lines', and 'full'.
 
     Returns:
-        dict: A dictionary mapping protein identifiers (str) to proteome identifiers (str).
+        dict: A dictionary mapping protein identifiers (str, or int fingerprints with --hash-keys) to proteome identifiers (str).
     """
     proteome_protein_map = {}
+    shared_protein_ids = []  # protein_ids found in more than one proteome
+    key = get_key_function(args)
+    get_proteome_id = proteome_id_function(args)
+
+    def _store_protein_id(protein_id):
+        # a protein_id found in a single proteome maps to that (shared) proteome_id string;
+        # from the second proteome on, the proteome_ids are collected in a list and joined only once
+        # at the end, instead of building a new comma-separated string for every extra proteome
+        if key is not None:  # --hash-keys: store a fingerprint instead
+            protein_id = key(protein_id)
+        proteome_ids = proteome_protein_map.get(protein_id)
+        if proteome_ids is None:
+            proteome_protein_map[protein_id] = proteome_id
+        elif proteome_ids.__class__ is str:
+            proteome_protein_map[protein_id] = [proteome_ids, proteome_id]
+            shared_protein_ids.append(protein_id)
+        else:
+            proteome_ids.append(proteome_id)
 
     def _process_protein_id(line):
         # store protein_id extracted from fasta headers
-        protein_id = line.rstrip("\n")[1:].split(" ")[0]
-        if protein_id not in proteome_protein_map:
-            proteome_protein_map[protein_id] = proteome_id
-        else:
-            proteome_protein_map[protein_id] += "," + proteome_id
+        _store_protein_id(line.rstrip("\n")[1:].split(" ", 1)[0])
 
-    if read_method not in {"lines", "full", "chunks"}:
+    if read_method not in {"grep", "scan", "prefetch", "lines", "full"}:
         eprint(f"ERROR: Invalid read_method '{read_method}' specified.")
         return proteome_protein_map
 
-    for file in fasta_files:
-        proteome_id = os.path.basename(file)
+    if read_method == "grep" and shutil.which("grep") is None:
+        # no grep available: fall back to reading the files in python
+        read_method = "scan"
+
+    if read_method == "grep":  # headers found by an external grep process
+        current_file = None
+        for file, protein_id in grep_fasta_headers(fasta_files):
+            if file != current_file:
+                current_file = file
+                proteome_id = get_proteome_id(file)
+            _store_protein_id(protein_id)
+    elif read_method == "prefetch":  # files read concurrently, then scanned
+        for file, data in prefetch_files(fasta_files):
+            proteome_id = get_proteome_id(file)
+            for protein_id in scan_fasta_headers(file, data):
+                _store_protein_id(protein_id)
+    else:
+        for file in fasta_files:
+            proteome_id = get_proteome_id(file)
+
+            if read_method == "scan":  # jump from header to header
+                for protein_id in scan_fasta_headers(file):
+                    _store_protein_id(protein_id)
+            elif read_method == "lines":  # read line by line, decoding only headers
+                with open(file, "rb", buffering=BUFFERSIZE) as fh:
+                    advise_sequential(fh, willneed=True)
+                    for line in fh:
+                        if line[:1] == b">":
+                            _store_protein_id(
+                                line.rstrip(b"\r\n")[1:].split(b" ", 1)[0].decode()
+                            )
+                    advise_done(fh)
+            elif read_method == "full":  # read whole file in memory
+                with open(file, "r") as fh:
+                    advise_sequential(fh, willneed=True)
+                    for line in fh.readlines():
+                        if line.startswith(">"):
+                            _process_protein_id(line)
+                    advise_done(fh)
+            else:
+                eprint(f"    => ERROR: no such read_method {read_method}")
 
-        # remove extension, if any
-        if args.extension is not None:
-            proteome_id = proteome_id[0 : -len(args.extension)]
-        else:
-            proteome_id = RE_REMOVE_EXTENSION.sub("", proteome_id)
-
-        # optionally remove prefix from the filenames
-        if args.prefix is not None:
-            proteome_id = proteome_id[len(args.prefix) :]
-
-        if read_method == "lines":  # read line by line
-            with open(file, "r") as fh:
-                for line in fh:
-                    if line.startswith(">"):
-                        _process_protein_id(line)
-        elif read_method == "full":  # read whole file in memory
-            with open(file, "r") as fh:
-                for line in fh.readlines():
-                    if line.startswith(">"):
-                        _process_protein_id(line)
-        elif read_method == "chunks":  # read file in chunks
-            for line in read_file_in_chunks(file):
-                if line.startswith(">"):  # fasta header
-                    _process_protein_id(line)
-        else:
-            eprint(f"    => ERROR: no such read_method {read_method}")
+    for protein_id in shared_protein_ids:
+        # proteins found in the same set of proteomes share one label string
+        proteome_protein_map[protein_id] = sys.intern(
+            ",".join(proteome_protein_map[protein_id])
+        )
 
     # eprint(list(proteome_protein_map.items())[:5]) #debug, first 5 items in the map
     # eprint(list(proteome_protein_map.items())[-5:]) #debug, last 5 items in the map
@@ -503,6 +980,170 @@ def create_proteome_protein_map(fasta_files, args, read_method=READMETHOD):
     return proteome_protein_map
 
 
+def _partition_of(protein_id, partitions_count):
+    """
+    return the partition of a map key: the same in every process (unlike hash() of a str)
+    """
+    if protein_id.__class__ is int:  # --hash-keys fingerprint
+        return protein_id % partitions_count
+    return crc32(protein_id.encode()) % partitions_count
+
+
+def _build_partitioned(indexed_shard, args, partitions_count, outprefix):
+    """
+    worker function to create the map for a shard of fasta files and write it to disk
+    split in partitions_count partitions by protein_id
+    """
+    index, fasta_files = indexed_shard
+    proteome_protein_map = create_proteome_protein_map(
+        fasta_files, args, read_method=READMETHOD
+    )
+    partitions = [{} for _ in range(partitions_count)]
+    for protein_id, proteome_ids in proteome_protein_map.items():
+        partitions[_partition_of(protein_id, partitions_count)][
+            protein_id
+        ] = proteome_ids
+    del proteome_protein_map
+
+    partition_files = []
+    for i, partition_map in enumerate(partitions):
+        partition_file = f"{outprefix}{index}_{i}"
+        with open(partition_file, "wb") as partition_fh:
+            pickle.dump(partition_map, partition_fh, protocol=pickle.HIGHEST_PROTOCOL)
+        partition_files.append(partition_file)
+    return partition_files
+
+
+def _merge_partition(partition_files):
+    """
+    worker function to merge the same partition written by every shard, in shard order
+    """
+    with open(partition_files[0], "rb") as partition_fh:
+        proteome_protein_map = pickle.load(partition_fh)
+    for partition_file in partition_files[1:]:
+        with open(partition_file, "rb") as partition_fh:
+            partial_map = pickle.load(partition_fh)
+        # only protein_ids found in more than one shard need joining
+        for protein_id, proteome_ids in partial_map.items():
+            old_proteome_ids = proteome_protein_map.get(protein_id)
+            if old_proteome_ids is None:
+                proteome_protein_map[protein_id] = proteome_ids
+            else:
+                proteome_protein_map[protein_id] = sys.intern(
+                    old_proteome_ids + "," + proteome_ids
+                )
+    delete_files(partition_files)
+    return proteome_protein_map
+
+
+def build_map_parallel(fasta_files, args, nproc):
+    """
+    Creates the protein->proteome map like create_proteome_protein_map, but splitting the fasta files
+    in nproc contiguous shards that are read in parallel by separate processes.
+    Each shard map is written to disk split in nproc partitions by protein_id; then nproc processes
+    merge one partition each from all shards, keeping the order of the fasta files for the proteome labels.
+    Since partitions do not share protein_ids, they only need to be added together at the end: this is still
+    done here, in a single thread, one partition at a time as they arrive (--scatter avoids it altogether
+    by labelling each partition in its own worker).
+
+    Args:
+        fasta_files (list): List of paths to the fasta files.
+        args (argparse.Namespace): Parsed arguments including prefix and extension options.
+        nproc (int): Number of worker processes.
+
+    Returns:
+        dict: A dictionary mapping protein identifiers (str) to proteome identifiers (str).
+    """
+    if nproc < 2 or len(fasta_files) < 2:
+        return create_proteome_protein_map(fasta_files, args, read_method=READMETHOD)
+
+    shard_size = ceil(len(fasta_files) / nproc)
+    shards = [
+        fasta_files[i : i + shard_size] for i in range(0, len(fasta_files), shard_size)
+    ]
+    with Pool(len(shards), maxtasksperchild=4) as pool:
+        # shuffle: every shard map is split into partitions by protein_id
+        shard_partition_files = pool.map(
+            partial(
+                _build_partitioned,
+                args=args,
+                partitions_count=nproc,
+                outprefix=args.out_file + "_part_",
+            ),
+            enumerate(shards),
+        )
+        # merge: the i-th partition of every shard, in shard order;
+        # each partition is added as soon as it arrives, so only one is held besides the map
+        partition_maps = pool.imap(_merge_partition, zip(*shard_partition_files))
+        proteome_protein_map = next(partition_maps)
+        for partition_map in partition_maps:
+            proteome_protein_map.update(partition_map)
+    return proteome_protein_map
+
+
+@lru_cache(maxsize=1 << 16)
+def _sort_labels(label):
+    """
+    return the comma separated proteome ids of a label sorted and deduplicated
+    (cached: the same label is usually found on many lines of a cluster)
+    """
+    return ",".join(sorted(set(label.split(","))))
+
+
+def _write_clusters_block(
+    output_fh,
+    cluster_ids,
+    protein_ids,
+    labels,
+    prev_cluster,
+    cluster_counter,
+    sortlabels=False,
+):
+    """
+    Writes a block of labelled lines to the output file, numbering the clusters with sequential integers
+    and marking the first protein_id of each cluster.
+
+    Args:
+        output_fh (file object): The output file.
+        cluster_ids (list): The cluster_ids of the block (not empty).
+        protein_ids (list): The protein_ids of the block.
+        labels (list): The proteome labels of the block.
+        prev_cluster (str): The last cluster_id of the previous block (None for the first block).
+        cluster_counter (int): The last cluster number of the previous block (-1 for the first block).
+        sortlabels (bool, optional): Whether to sort (and uniq) the proteome labels. Default is False.
+
+    Returns:
+        tuple: (last cluster_id, last cluster number) of this block, to be passed with the next block.
+    """
+    # a new cluster starts wherever the cluster_id changes
+    new_cluster = list(map(ne, cluster_ids, [prev_cluster] + cluster_ids[:-1]))
+    cluster_counters = list(accumulate(new_cluster, initial=cluster_counter))
+    del cluster_counters[0]
+
+    if sortlabels:
+        # sort each distinct label of the block once: lines of a cluster usually share the same label
+        sorted_labels = {
+            label: _sort_labels(label) for label in set(labels) if "," in label
+        }
+        labels = list(map(sorted_labels.get, labels, labels))
+
+    output_fh.write(
+        "".join(
+            [
+                (
+                    f"{counter}\t{protein_id}\t{label}\t*\n"
+                    if is_new
+                    else f"{counter}\t{protein_id}\t{label}\t\n"
+                )
+                for counter, protein_id, label, is_new in zip(
+                    cluster_counters, protein_ids, labels, new_cluster
+                )
+            ]
+        )
+    )
+    return cluster_ids[-1], cluster_counters[-1]
+
+
 def label_proteins(
     input_file,
     output_file,
@@ -510,10 +1151,14 @@ def label_proteins(
     nolabel="",
     sortlabels=False,
     uniq=False,
+    key=None,
 ):
     """
     Use the provided mapping to label the input_file, assigning proteome labels to protein_ids.
     Optionally sort (and uniq) the attached labels.
+    The input is processed in blocks of lines: splitting into columns, detecting new clusters,
+    numbering them and looking up labels are done per block with builtins running in C,
+    rather than with Python statements per line.
 
     Args:
         input_file (str): Path to the input file with protein identifiers.
@@ -522,61 +1167,114 @@ def label_proteins(
         nolabel (str, optional): Label to use for proteins without a match. Default is "".
         sortlabels (bool, optional): Whether to sort the proteome labels. Default is False.
         uniq (bool, optional): Whether to skip identical lines in input. Default is False.
+        key (function, optional): Function turning protein_ids into map keys, see get_key_function. Default is None.
 
     Returns:
         int: The total number of clusters processed.
     """
     cluster_counter = -1
     prev_cluster = None
-    prev_line = ""
-
-    def _label_line(line):
-        cluster_id, protein_id = line.rstrip("\n").split("\t")
-        proteome_ids = proteome_protein_map.get(protein_id, nolabel)
-        if sortlabels and "," in proteome_ids:
-            proteome_ids = ",".join(sorted(set(proteome_ids.split(","))))
-        return cluster_id, protein_id, proteome_ids
+    prev_protein = None
+    get_proteome_ids = proteome_protein_map.get
 
     with open(input_file, "r") as input_fh:
+        advise_sequential(input_fh)
         with open(output_file, "w") as output_fh:
             output_fh.write(HEADER)
-            if uniq:
-                for line in input_fh:
-                    if prev_line == line:
-                        continue  # skip this line
-                    else:
-                        prev_line = line  # to check next
-                    cluster_id, protein_id, proteome_ids = _label_line(line)
-                    if cluster_id != prev_cluster:
-                        prev_cluster = cluster_id
-                        cluster_counter += 1
-                        output_fh.write(
-                            f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t*\n"
-                        )
-                    else:
-                        output_fh.write(
-                            f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t\n"
-                        )
-            else:
-                for line in input_fh:
-                    cluster_id, protein_id, proteome_ids = _label_line(line)
-                    if cluster_id != prev_cluster:
-                        prev_cluster = cluster_id
-                        cluster_counter += 1
-                        output_fh.write(
-                            f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t*\n"
-                        )
-                    else:
-                        output_fh.write(
-                            f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t\n"
+            for block in read_line_blocks(input_fh):
+                if not _has_columns(block, 2):
+                    raise ValueError(
+                        f"    => ERROR: file '{input_file}' has unexpected format: expected two columns"
+                    )
+                # split a whole block of lines into its two columns in one go
+                fields = block.replace("\n", "\t").split("\t")
+                fields.pop()  # empty string after the last newline
+                cluster_ids = fields[0::2]
+                protein_ids = fields[1::2]
+
+                if uniq:  # skip lines identical to the previous one
+                    keep = list(
+                        map(
+                            or_,
+                            map(ne, cluster_ids, [prev_cluster] + cluster_ids[:-1]),
+                            map(ne, protein_ids, [prev_protein] + protein_ids[:-1]),
                         )
+                    )
+                    prev_protein = protein_ids[-1]
+                    cluster_ids = list(compress(cluster_ids, keep))
+                    protein_ids = list(compress(protein_ids, keep))
+                    if not cluster_ids:
+                        continue
+
+                keys = protein_ids if key is None else map(key, protein_ids)
+                labels = list(map(get_proteome_ids, keys, repeat(nolabel)))
+                prev_cluster, cluster_counter = _write_clusters_block(
+                    output_fh,
+                    cluster_ids,
+                    protein_ids,
+                    labels,
+                    prev_cluster,
+                    cluster_counter,
+                    sortlabels=sortlabels,
+                )
 
     return cluster_counter + 1
 
 
+def label_proteins_awk(input_file, output_file, proteome_protein_map, awk, nolabel=""):
+    """
+    Same as label_proteins without sortlabels and uniq, but the labelling is done by an awk process:
+    the map is written to a temporary tsv file, which awk loads in an associative array
+    before going through the input file.
+
+    Args:
+        input_file (str): Path to the input file with protein identifiers.
+        output_file (str): Path to the output file where results are written.
+        proteome_protein_map (dict): A dictionary mapping protein_id to proteome labels.
+        awk (str): Path to the awk command.
+        nolabel (str, optional): Label to use for proteins without a match. Default is "".
+
+    Returns:
+        int: The total number of clusters processed.
+    """
+    map_file = output_file + "_map"
+    with open(map_file, "w") as map_fh:
+        map_fh.write(
+            "".join(
+                [
+                    f"{protein_id}\t{proteome_ids}\n"
+                    for protein_id, proteome_ids in proteome_protein_map.items()
+                ]
+            )
+        )
+    with open(output_file, "w") as output_fh:
+        output_fh.write(HEADER)
+
+    try:
+        result = subprocess.run(
+            [awk, AWK_LABEL_PROGRAM, map_file, input_file],
+            stdout=subprocess.PIPE,
+            env={**os.environ, "NOLABEL": nolabel, "OUTFILE": output_file},
+            text=True,
+        )
+    finally:
+        delete_files([map_file])
+    if result.returncode != 0:
+        raise ValueError(
+            f"    => ERROR: awk failed labelling file '{input_file}' with exit status {result.returncode}"
+        )
+    return int(result.stdout)
+
+
 # functions for distributed approach
 def re_label_proteins(
-    input_file, output_file, proteome_protein_map, nolabel="", uniq=False
+    input_file,
+    output_file,
+    proteome_protein_map,
+    nolabel="",
+    uniq=False,
+    key=None,
+    already_labelled=None,
 ):
     """
     Relabel the input file using the provided mapping of protein IDs to proteome labels.
@@ -588,6 +1286,9 @@ def re_label_proteins(
     - proteome_protein_map (dict): A mapping from protein IDs to proteome labels.
     - nolabel (str): Default label to use if no label is found for a protein.
     - uniq (bool): If True, duplicate lines in the input file are skipped.
+    - key (function): Function turning protein_ids into map keys, see get_key_function. Default is None.
+    - already_labelled (bool): Whether the input file has been labelled before (3 columns) or not (2 columns).
+        Default is None: find out from the first line of the file.
 
     Returns:
     - None: This function modifies the output file in-place and does not return any value.
@@ -595,76 +1296,102 @@ def re_label_proteins(
     Note:
         cluster_id (first column) will be converted to cluster_counter when combining all chunks.
     """
-    already_labelled = False
     with open(input_file, "r") as input_fh:
-        # check if this file has been labelled before
-        first_line = input_fh.readline()
-        fields_count = len(first_line.split("\t"))
-        if fields_count == 3:  # previously labelled (3 columns file)
-            already_labelled = True
-        elif fields_count == 2:  # never labelled (2 columns file)
-            pass
-        else:
-            raise ValueError(
-                f"    => ERROR: file '{input_file}' has unexpected format: number of columns is {fields_count}: {first_line}"
-            )
+        if already_labelled is None:
+            # check if this file has been labelled before
+            first_line = input_fh.readline()
+            fields_count = len(first_line.split("\t"))
+            if fields_count == 3:  # previously labelled (3 columns file)
+                already_labelled = True
+            elif fields_count == 2:  # never labelled (2 columns file)
+                already_labelled = False
+            else:
+                raise ValueError(
+                    f"    => ERROR: file '{input_file}' has unexpected format: number of columns is {fields_count}: {first_line}"
+                )
+            input_fh.seek(0)  # reset to beginning of file to include first line
 
-        input_fh.seek(0)  # reset to beginning of file to include first line
+        advise_sequential(input_fh)
+        columns = 3 if already_labelled else 2
+        prev_cluster = None
+        prev_protein = None
+        get_proteome_ids = proteome_protein_map.get
         with open(output_file, "w") as output_fh:
-            if already_labelled:  # previously labelled
-                for line in input_fh:
-                    cluster_id, protein_id, old_proteome_ids = line.rstrip("\n").split(
-                        "\t"
+            for block in read_line_blocks(input_fh):
+                if not _has_columns(block, columns):
+                    raise ValueError(
+                        f"    => ERROR: file '{input_file}' has unexpected format: expected {columns} columns"
                     )
-                    combined_proteome_ids = old_proteome_ids
-                    new_proteome_ids = proteome_protein_map.get(protein_id, nolabel)
-                    if combined_proteome_ids:
-                        if new_proteome_ids:  # if there is data to combine
-                            combined_proteome_ids += "," + new_proteome_ids  # append
-                    else:
-                        combined_proteome_ids = new_proteome_ids
-                    output_fh.write(
-                        f"{cluster_id}\t{protein_id}\t{combined_proteome_ids}\n"
-                    )
-            else:  # never labelled
-                if uniq:
-                    prev_line = ""
-                    for line in input_fh:
-                        if prev_line == line:
-                            continue  # skip this line
-                        else:
-                            prev_line = line  # to check next
-                        cluster_id, protein_id = line.rstrip("\n").split("\t")
-                        output_fh.write(
-                            f"{cluster_id}\t{protein_id}\t{proteome_protein_map.get(protein_id, nolabel)}\n"
-                        )
-                else:
-                    for line in input_fh:
-                        cluster_id, protein_id = line.rstrip("\n").split("\t")
-                        output_fh.write(
-                            f"{cluster_id}\t{protein_id}\t{proteome_protein_map.get(protein_id, nolabel)}\n"
+                # split a whole block of lines into its columns in one go
+                fields = block.replace("\n", "\t").split("\t")
+                fields.pop()  # empty string after the last newline
+                cluster_ids = fields[0::columns]
+                protein_ids = fields[1::columns]
+                keys = protein_ids if key is None else map(key, protein_ids)
+                new_proteome_ids = map(get_proteome_ids, keys, repeat(nolabel))
+
+                if already_labelled:  # previously labelled
+                    # append the new labels to the old ones, if there is data to combine
+                    labels = [
+                        old + "," + new if old and new else old or new
+                        for old, new in zip(fields[2::3], new_proteome_ids)
+                    ]
+                else:  # never labelled
+                    if uniq:  # skip lines identical to the previous one
+                        keep = list(
+                            map(
+                                or_,
+                                map(ne, cluster_ids, [prev_cluster] + cluster_ids[:-1]),
+                                map(ne, protein_ids, [prev_protein] + protein_ids[:-1]),
+                            )
                         )
+                        prev_cluster = cluster_ids[-1]
+                        prev_protein = protein_ids[-1]
+                        cluster_ids = list(compress(cluster_ids, keep))
+                        protein_ids = list(compress(protein_ids, keep))
+                        new_proteome_ids = compress(new_proteome_ids, keep)
+                    labels = new_proteome_ids
+
+                output_fh.write(
+                    "".join(
+                        [
+                            f"{cluster_id}\t{protein_id}\t{label}\n"
+                            for cluster_id, protein_id, label in zip(
+                                cluster_ids, protein_ids, labels
+                            )
+                        ]
+                    )
+                )
 
 
 def _find_next_newline(fp, filesize, startpos):
     """
     Return the position of the first newline found after the given starting position in the file.
 
+    The file is read in binary blocks searched with bytes.find, without decoding them.
+
     Args:
-    - fp (file object): The file object to read from.
+    - fp (file object): The file object to read from, opened in binary mode.
     - filesize (int): The size of the file in bytes.
     - startpos (int): The position in the file from where the search for the next newline starts.
 
     Returns:
     - int: The position (in bytes) of the first newline character after the starting position, or the file size if no newline is found.
     """
-    if startpos > filesize:
+    if startpos >= filesize:
         return filesize
     if startpos <= 0:
         return 0
-    fp.seek(startpos - 1)
-    fp.readline()  # to avoid truncatedlines
-    return fp.tell()
+    pos = startpos - 1  # a newline right before startpos ends the line there
+    fp.seek(pos)
+    while True:
+        block = fp.read(65536)
+        if not block:
+            return filesize  # to avoid truncated lines
+        newline = block.find(b"\n")
+        if newline != -1:
+            return pos + newline + 1
+        pos += len(block)
 
 
 def compute_split_positions(filename, splitsize):
@@ -689,7 +1416,7 @@ def compute_split_positions(filename, splitsize):
 
     split_file_startpos = [0]  # first split start position is 0 (start of file)
     split_file_sizes = list()  # init
-    with open(filename, "r", 1) as inputfh:
+    with open(filename, "rb", buffering=0) as inputfh:
         split_file_end = _find_next_newline(inputfh, input_filesize, splitsize)
         split_file_sizes.append(split_file_end)
         while split_file_end != input_filesize:
@@ -703,33 +1430,22 @@ def compute_split_positions(filename, splitsize):
     return split_file_startpos, split_file_sizes
 
 
-def clone_file(filename, copies_num, outprefix, buffersize=BUFFERSIZE):
+def clone_file(filename, copies_num, outprefix):
     """
-    create multiple copies of an input file by writing each line to multiple output files simultaneously
+    create multiple copies of an input file, one after the other;
+    shutil.copyfile copies in the kernel (os.sendfile) where available, without passing the data through python
 
     Args:
         filename (str): Path to the input file.
         copies_num (int): Number of copies to create.
         outprefix (str): Prefix for the output file names.
-        buffersize (int): Number of bytes to read and write at a time. Default is 1MB.
 
     Returns:
         list: A list of filenames for the cloned files.
     """
     cloned_files = [outprefix + str(i) for i in range(copies_num)]
-    file_handles = [open(filename, "wb") for filename in cloned_files]
-
-    try:
-        with open(filename, "rb") as infile:
-            while True:
-                chunk = infile.read(buffersize)
-                if not chunk:
-                    break  # end of file
-                for handle in file_handles:
-                    handle.write(chunk)
-    finally:
-        for handle in file_handles:
-            handle.close()
+    for cloned_file in cloned_files:
+        shutil.copyfile(filename, cloned_file)
 
     return cloned_files
 
@@ -808,33 +1524,100 @@ def siprefix2num(numberstring):
     if numberstring == "0":
         return 0
 
-    prefix = {"k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4, "p": 1024**5}
     numberstring = numberstring.lower()
-    try:
-        return int(numberstring[:-1]) * prefix[numberstring[-1]]
-    except KeyError:
-        # no or unknown meter-prefix
+    multiplier = SIPREFIXES.get(numberstring[-1:])
+    if multiplier is None:  # no or unknown meter-prefix
         return int(numberstring)
+    return int(numberstring[:-1]) * multiplier
 
 
-def simply_label(filename, my_proteome_protein_map, nolabel="", uniq=False):
+def simply_label(
+    filename,
+    my_proteome_protein_map,
+    nolabel="",
+    uniq=False,
+    key=None,
+    already_labelled=None,
+):
     """
-    Annotates identifiers in a file using a provided mapping and writes the updated contents to a temporary file. The temporary file is then renamed to the input filename.
+    Annotates identifiers in a file using a provided mapping and writes the updated contents to a temporary file. The temporary file then replaces the input file.
 
     Args:
         filename (str): The path to the file to be annotated.
         my_proteome_protein_map (dict): A dictionary mapping protein identifiers to labels.
         nolabel (str, optional): A string to mark when no mapping was found. Default is an empty string.
         uniq (bool, optional): A flag indicating whether to unique input lines. Default is False.
+        key (function, optional): Function turning protein_ids into map keys, see get_key_function. Default is None.
+        already_labelled (bool, optional): Whether the file has been labelled before. Default is None (find out from the file).
 
     Returns:
         None: The file is overwritten with the labeled data.
     """
     labelled_file = filename + "_tmp"
     re_label_proteins(
-        filename, labelled_file, my_proteome_protein_map, nolabel=nolabel, uniq=uniq
+        filename,
+        labelled_file,
+        my_proteome_protein_map,
+        nolabel=nolabel,
+        uniq=uniq,
+        key=key,
+        already_labelled=already_labelled,
     )
-    os.rename(labelled_file, filename)
+    # the labelled file stays in the page cache on purpose: the next batch reads it again
+    os.replace(labelled_file, filename)
+
+
+def _raise_lock_timeout(signum, frame):
+    """
+    SIGALRM handler interrupting a blocking flock call
+    """
+    raise TimeoutError("timed out waiting for file lock")
+
+
+def acquire_flock(lock_file, timeout=None):
+    """
+    Opens (creating it if needed) a lock file and locks it exclusively with flock. While waiting the
+    process sleeps in the kernel, which wakes it up as soon as the lock is released: there is no polling.
+    The lock file is separate from the chunk because the chunk is replaced by a new file when labelled.
+
+    Args:
+        lock_file (str): Path to the lock file.
+        timeout (float, optional): Number of seconds after which to give up waiting (with an alarm signal).
+            Default is None: do not wait at all if the lock is taken.
+
+    Returns:
+        int: The file descriptor holding the lock, to be passed to release_flock.
+
+    Raises:
+        TimeoutError: If the lock could not be acquired.
+    """
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if timeout is None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise TimeoutError(f"file lock '{lock_file}' is taken") from None
+        else:
+            previous_handler = signal.signal(signal.SIGALRM, _raise_lock_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous_handler)
+    except BaseException:
+        os.close(fd)  # also releases the lock, if acquired just as the alarm went off
+        raise
+    return fd
+
+
+def release_flock(fd):
+    """
+    Releases a lock acquired with acquire_flock and closes its file descriptor.
+    """
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
 
 
 def lock_and_label(
@@ -844,29 +1627,30 @@ def lock_and_label(
     uniq=False,
     timeout=90,
     workerid=None,
+    key=None,
+    wait=True,
 ):
     """
     Annotates identifiers in a chunk of a file while ensuring that no other processes concurrently modify the file.
-    Uses a file lock mechanism to prevent race conditions during the annotation process.
+    Uses a file lock (flock on a '.lock' file next to the chunk) to prevent race conditions during the annotation process.
 
     Args:
         file_chunk (str): The path to the chunk of the file to be annotated.
         my_proteome_protein_map (dict): A dictionary mapping protein identifiers to labels.
         nolabel (str, optional): A string to mark when no mapping was found. Default is an empty string.
         uniq (bool, optional): A flag indicating whether to unique input lines. Default is False.
+        key (function, optional): Function turning protein_ids into map keys, see get_key_function. Default is None.
+        wait (bool, optional): Whether to wait for the lock up to timeout seconds, or give up at once if it is taken. Default is True.
 
     Returns:
-        int: Returns 1 if labeling was successful, 0 if it timed out.
+        int: Returns 1 if labeling was successful, 0 if it timed out (or the lock was taken, with wait=False).
     """
-    lock = FileLock(file_chunk + ".lock")
     my_timeout = timeout + randint(0, 20)
     try:
-        with lock.acquire(timeout=my_timeout):
-            simply_label(
-                file_chunk, my_proteome_protein_map, nolabel=nolabel, uniq=uniq
-            )
-            return 1
-    except Timeout:
+        lock_fd = acquire_flock(file_chunk + ".lock", my_timeout if wait else None)
+    except TimeoutError:
+        if not wait:
+            return 0  # lock taken: the caller will come back to this chunk later
         if workerid is None:
             eprint(
                 f"    ERROR: giving up waiting to acquire file lock for 'f{file_chunk}' after trying for {secs2time(my_timeout)}"
@@ -877,10 +1661,18 @@ def lock_and_label(
             )
         return 0
 
-    # with lock:
-    #   simply_label(file_chunk, my_proteome_protein_map, nolabel=nolabel, uniq=uniq)
-
-    # file is now ready for being labelled by other processes
+    try:
+        simply_label(
+            file_chunk,
+            my_proteome_protein_map,
+            nolabel=nolabel,
+            uniq=uniq,
+            key=key,
+        )
+    finally:
+        # file is now ready for being labelled by other processes
+        release_flock(lock_fd)
+    return 1
 
 
 def combine_output_chunks(output_chunk_paths, out_file, sortlabels=False, uniq=False):
@@ -899,30 +1691,55 @@ def combine_output_chunks(output_chunk_paths, out_file, sortlabels=False, uniq=F
     """
     cluster_counter = -1
     prev_cluster = None
-    prev_line = ""
+    prev_protein = None
+    prev_labels = None
     with open(out_file, "w") as output_fh:
         output_fh.write(HEADER)
         for chunk_file in output_chunk_paths:
             with open(chunk_file, "r") as input_fh:
-                for line in input_fh:
-                    if uniq:
-                        if prev_line == line:
-                            continue  # skip this line
-                        else:
-                            prev_line = line  # to check next
-                    cluster_id, protein_id, proteome_ids = line.rstrip("\n").split("\t")
-                    if sortlabels and "," in proteome_ids:
-                        proteome_ids = ",".join(sorted(set(proteome_ids.split(","))))
-                    if cluster_id != prev_cluster:
-                        prev_cluster = cluster_id
-                        cluster_counter += 1
-                        output_fh.write(
-                            f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t*\n"
+                advise_sequential(input_fh)
+                for block in read_line_blocks(input_fh):
+                    if not _has_columns(block, 3):
+                        raise ValueError(
+                            f"    => ERROR: file '{chunk_file}' has unexpected format: expected three columns"
                         )
-                    else:
-                        output_fh.write(
-                            f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t\n"
+                    # split a whole block of lines into its three columns in one go
+                    fields = block.replace("\n", "\t").split("\t")
+                    fields.pop()  # empty string after the last newline
+                    cluster_ids = fields[0::3]
+                    protein_ids = fields[1::3]
+                    labels = fields[2::3]
+
+                    if uniq:  # skip lines identical to the previous one
+                        # plain != per column: str comparison rejects on length first and stops at the
+                        # first different character, hashing the lines would read all of them in full
+                        new_clusters = map(
+                            ne, cluster_ids, [prev_cluster] + cluster_ids[:-1]
+                        )
+                        new_proteins = map(
+                            ne, protein_ids, [prev_protein] + protein_ids[:-1]
+                        )
+                        new_labels = map(ne, labels, [prev_labels] + labels[:-1])
+                        keep = list(
+                            map(or_, map(or_, new_clusters, new_proteins), new_labels)
                         )
+                        prev_protein = protein_ids[-1]
+                        prev_labels = labels[-1]
+                        cluster_ids = list(compress(cluster_ids, keep))
+                        protein_ids = list(compress(protein_ids, keep))
+                        labels = list(compress(labels, keep))
+                        if not cluster_ids:
+                            continue
+
+                    prev_cluster, cluster_counter = _write_clusters_block(
+                        output_fh,
+                        cluster_ids,
+                        protein_ids,
+                        labels,
+                        prev_cluster,
+                        cluster_counter,
+                        sortlabels=sortlabels,
+                    )
 
     return cluster_counter + 1
 
@@ -932,6 +1749,8 @@ def combine_output_files(output_file_paths, out_file, sortlabels=False, uniq=Fal
     """
     Combines multiple output files into a single file, assigning unique sequential cluster identifiers.
     Optionally, it sorts and deduplicates labels in each line.
+    The files are copies of the same input labelled by different workers, so they are read in lockstep,
+    a block of lines at a time, joining the labels found for the same line in every file.
 
     Args:
         output_file_paths (list): List of file paths to the files to be combined.
@@ -946,46 +1765,77 @@ def combine_output_files(output_file_paths, out_file, sortlabels=False, uniq=Fal
     """
     cluster_counter = -1
     prev_cluster = None
-    prev_line = ""
+    prev_protein = None
     input_filehandles = [open(filename, "r") for filename in output_file_paths]
 
     try:
+        for input_fh in input_filehandles:
+            advise_sequential(input_fh)
+        first_fh, *other_fhs = input_filehandles
         with open(out_file, "w") as output_fh:
             output_fh.write(HEADER)
-            for lines in zip(
-                *input_filehandles
-            ):  # simultaneously go through all file line by line
-                cluster_id, protein_id, proteome_ids = (
-                    lines[0].rstrip("\n").split("\t")
-                )  # take all info from the first file
-                if uniq:
-                    if prev_line == "\t".join([cluster_id, protein_id]):
-                        continue  # skip this line
-                    else:
-                        prev_line = "\t".join([cluster_id, protein_id])  # to check next
-
-                for line in lines[1:]:
-                    new_proteome_ids = line.rstrip("\n").split("\t")[
-                        2
-                    ]  # take only proteome_id from all other files
-                    if new_proteome_ids:
-                        proteome_ids += "," + new_proteome_ids
-
-                proteome_ids = proteome_ids.lstrip(
-                    ","
-                )  # remove initial space if present
-                if sortlabels and "," in proteome_ids:
-                    proteome_ids = ",".join(sorted(set(proteome_ids.split(","))))
-
-                if cluster_id != prev_cluster:
-                    prev_cluster = cluster_id
-                    cluster_counter += 1
-                    output_fh.write(
-                        f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t*\n"
+            while True:
+                # take all info from the first file
+                lines = first_fh.readlines(BUFFERSIZE)
+                if not lines:
+                    break
+                block = "".join(lines)
+                if not _has_columns(block, 3):
+                    raise ValueError(
+                        f"    => ERROR: file '{first_fh.name}' has unexpected format: expected three columns"
                     )
-                else:
-                    output_fh.write(
-                        f"{cluster_counter}\t{protein_id}\t{proteome_ids}\t\n"
+                fields = block.replace("\n", "\t").split("\t")
+                fields.pop()  # empty string after the last newline
+                cluster_ids = fields[0::3]
+                protein_ids = fields[1::3]
+                labels = fields[2::3]
+
+                for input_fh in other_fhs:
+                    # take only the labels of the same lines from all other files
+                    other_fields = (
+                        "".join(islice(input_fh, len(lines)))
+                        .replace("\n", "\t")
+                        .split("\t")
+                    )
+                    other_fields.pop()
+                    if other_fields[1::3] != protein_ids:
+                        raise ValueError(
+                            f"    => ERROR: file '{input_fh.name}' does not have the same lines as '{first_fh.name}'"
+                        )
+                    labels = [
+                        old + "," + new if old and new else old or new
+                        for old, new in zip(labels, other_fields[2::3])
+                    ]
+
+                if uniq:  # skip lines identical to the previous one
+                    keep = list(
+                        map(
+                            or_,
+                            map(ne, cluster_ids, [prev_cluster] + cluster_ids[:-1]),
+                            map(ne, protein_ids, [prev_protein] + protein_ids[:-1]),
+                        )
+                    )
+                    prev_protein = protein_ids[-1]
+                    cluster_ids = list(compress(cluster_ids, keep))
+                    protein_ids = list(compress(protein_ids, keep))
+                    labels = list(compress(labels, keep))
+                    if not cluster_ids:
+                        continue
+
+                prev_cluster, cluster_counter = _write_clusters_block(
+                    output_fh,
+                    cluster_ids,
+                    protein_ids,
+                    labels,
+                    prev_cluster,
+                    cluster_counter,
+                    sortlabels=sortlabels,
+                )
+
+            for input_fh in other_fhs:
+                if input_fh.readline():
+                    raise ValueError(
+                        f"    => ERROR: file '{input_fh.name}' has more lines than '{first_fh.name}'"
                     )
 
     finally:  # close opened file handles
@@ -995,21 +1845,311 @@ def combine_output_files(output_file_paths, out_file, sortlabels=False, uniq=Fal
     return cluster_counter + 1
 
 
-def initializer(file_chunks_arg, args_arg):
+# for streamed approach:
+def external_sort_command(keys, threads=1, tmpdir=None):
+    """
+    Returns the command line for sorting a tab separated file with the system sort command.
+    It has to be run with LC_ALL=C, so that lines are compared byte by byte, which for utf-8 text
+    gives the same order as comparing python strings.
+
+    Args:
+        keys (list): sort key options, e.g. ["-k2,2"].
+        threads (int, optional): Number of threads sort can use. Default is 1.
+        tmpdir (str, optional): Directory for the temporary files of sort. Default is None (sort's default).
+
+    Returns:
+        list: The command and its arguments.
+    """
+    command = ["sort", "-t", "\t", *keys, "-S", SORTMEMORY, f"--parallel={threads}"]
+    if tmpdir:
+        command += ["-T", tmpdir]
+    return command
+
+
+def sort_input_by_protein(input_file, sorted_file, threads=1):
+    """
+    Numbers the lines of the input file and sorts them by protein id (second column) into sorted_file,
+    whose lines are then: line_number, cluster_id, protein_id.
+
+    Args:
+        input_file (str): Path to the input file (two columns).
+        sorted_file (str): Path to the numbered and sorted file that will be created.
+        threads (int, optional): Number of threads sort can use. Default is 1.
+
+    Returns:
+        int: The number of lines in the input file.
+    """
+    lines_count = 0
+    numbers = count()
+    with open(sorted_file, "w") as sorted_fh:
+        sort_proc = subprocess.Popen(
+            external_sort_command(
+                ["-k3,3"], threads, os.path.dirname(os.path.abspath(sorted_file))
+            ),
+            stdin=subprocess.PIPE,
+            stdout=sorted_fh,
+            env={**os.environ, "LC_ALL": "C"},
+            text=True,
+        )
+        with open(input_file, "r") as input_fh:
+            advise_sequential(input_fh)
+            for block in read_line_blocks(input_fh):
+                lines = block.split("\n")
+                lines.pop()  # empty string after the last newline
+                lines_count += len(lines)
+                sort_proc.stdin.write(
+                    "".join([f"{n}\t{line}\n" for n, line in zip(numbers, lines)])
+                )
+        sort_proc.stdin.close()
+        if sort_proc.wait() != 0:
+            raise RuntimeError(f"sort failed with exit status {sort_proc.returncode}")
+    return lines_count
+
+
+def write_sorted_map(indexed_batch, args, outprefix):
+    """
+    Creates the partial dictionary for a batch of fasta files and writes it to disk sorted by protein id,
+    one "protein_id<tab>proteome_ids" line per entry.
+
+    Args:
+        indexed_batch (tuple): (batch index, list of paths to the fasta files of the batch).
+        args (argparse.Namespace): Parsed arguments including prefix and extension options.
+        outprefix (str): Prefix for the output file name, to which the batch index is appended.
+
+    Returns:
+        tuple: (path of the sorted map file, number of protein ids in the map).
+    """
+    index, batch_files = indexed_batch
+    proteome_protein_map = create_proteome_protein_map(
+        batch_files, args, read_method=READMETHOD
+    )
+    map_file = outprefix + str(index)
+    with open(map_file, "w") as map_fh:
+        map_fh.write(
+            "".join(
+                [
+                    f"{protein_id}\t{proteome_ids}\n"
+                    for protein_id, proteome_ids in sorted(proteome_protein_map.items())
+                ]
+            )
+        )
+    return map_file, len(proteome_protein_map)
+
+
+def _read_sorted_map(map_file, index):
+    """
+    yield (protein_id, index, proteome_ids) from a sorted map file written by write_sorted_map
+    """
+    with open(map_file, "r") as map_fh:
+        advise_sequential(map_fh)
+        for line in map_fh:
+            protein_id, proteome_ids = line[:-1].split("\t", 1)
+            yield protein_id, index, proteome_ids
+
+
+def merge_sorted_maps(map_files):
+    """
+    Merges sorted map files into a single stream sorted by protein id. Proteome ids found for the same
+    protein id in different files are joined in the order of map_files.
+
+    Args:
+        map_files (list): Paths to the sorted map files, in batch order.
+
+    Yields:
+        tuple: (protein_id, proteome_ids) with each protein_id appearing once.
+    """
+    streams = [_read_sorted_map(map_file, i) for i, map_file in enumerate(map_files)]
+    for protein_id, entries in groupby(merge(*streams), key=lambda entry: entry[0]):
+        yield protein_id, ",".join([proteome_ids for _, _, proteome_ids in entries])
+
+
+def streamed_label(sorted_file, map_files, labelled_file, nolabel="", threads=1):
+    """
+    Labels the input file, sorted by protein id by sort_input_by_protein, with a single merge pass
+    against the sorted map files, then restores the original line order.
+    The result has the three columns cluster_id, protein_id, proteome_ids, as expected by combine_output_chunks.
+
+    Args:
+        sorted_file (str): Path to the numbered input file sorted by protein id.
+        map_files (list): Paths to the sorted map files, in batch order.
+        labelled_file (str): Path to the labelled file that will be created.
+        nolabel (str, optional): Label to use for proteins without a match. Default is "".
+        threads (int, optional): Number of threads sort can use. Default is 1.
+
+    Returns:
+        None
+    """
+    entries = merge_sorted_maps(map_files)
+    map_protein_id, map_proteome_ids = next(entries, (None, None))
+
+    with open(labelled_file, "w") as labelled_fh:
+        # sort back by line number and drop it
+        sort_proc = subprocess.Popen(
+            external_sort_command(
+                ["-k1,1n"], threads, os.path.dirname(os.path.abspath(labelled_file))
+            ),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={**os.environ, "LC_ALL": "C"},
+            text=True,
+        )
+        cut_proc = subprocess.Popen(
+            ["cut", "-f2-"], stdin=sort_proc.stdout, stdout=labelled_fh
+        )
+        sort_proc.stdout.close()  # cut is the only reader
+
+        with open(sorted_file, "r") as sorted_fh:
+            advise_sequential(sorted_fh)
+            for block in read_line_blocks(sorted_fh):
+                out_lines = []
+                for line in block.split("\n")[:-1]:
+                    protein_id = line[line.rindex("\t") + 1 :]
+                    # advance the map stream up to this protein id
+                    while map_protein_id is not None and map_protein_id < protein_id:
+                        map_protein_id, map_proteome_ids = next(entries, (None, None))
+                    if map_protein_id == protein_id:
+                        out_lines.append(f"{line}\t{map_proteome_ids}\n")
+                    else:
+                        out_lines.append(f"{line}\t{nolabel}\n")
+                sort_proc.stdin.write("".join(out_lines))
+        sort_proc.stdin.close()
+        if sort_proc.wait() != 0:
+            raise RuntimeError(f"sort failed with exit status {sort_proc.returncode}")
+        if cut_proc.wait() != 0:
+            raise RuntimeError(f"cut failed with exit status {cut_proc.returncode}")
+
+
+def scatter_input(input_file, partitions_count, outprefix, key=None):
+    """
+    Numbers the lines of the input file and scatters them by protein id (second column) into
+    partitions_count files, using the same partitions as _build_partitioned, so that every partition
+    of the input can be labelled with the matching partition of the map only.
+    The lines of the partition files are: line_number, cluster_id, protein_id, in increasing line number.
+
+    Args:
+        input_file (str): Path to the input file (two columns).
+        partitions_count (int): Number of partitions.
+        outprefix (str): Prefix for the partition file names, to which the partition index is appended.
+        key (function): Function turning protein_ids into map keys, see get_key_function. Default is None.
+
+    Returns:
+        tuple: (list of paths of the partition files, number of lines in the input file).
+    """
+    lines_count = 0
+    numbers = count()
+    partition_files = [f"{outprefix}{i}" for i in range(partitions_count)]
+    partition_fhs = [open(partition_file, "w") for partition_file in partition_files]
+    try:
+        with open(input_file, "r") as input_fh:
+            advise_sequential(input_fh)
+            for block in read_line_blocks(input_fh):
+                lines = block.split("\n")
+                lines.pop()  # empty string after the last newline
+                lines_count += len(lines)
+                protein_ids = [line[line.index("\t") + 1 :] for line in lines]
+                keys = protein_ids if key is None else map(key, protein_ids)
+                partition_lines = [[] for _ in range(partitions_count)]
+                for n, line, partition in zip(
+                    numbers,
+                    lines,
+                    map(_partition_of, keys, repeat(partitions_count)),
+                ):
+                    partition_lines[partition].append(f"{n}\t{line}\n")
+                for partition_fh, out_lines in zip(partition_fhs, partition_lines):
+                    partition_fh.write("".join(out_lines))
+    finally:
+        for partition_fh in partition_fhs:
+            partition_fh.close()
+    return partition_files, lines_count
+
+
+def label_partition(partition, nolabel="", key=None):
     """
-    initializer to set global variables for workers
+    worker function to merge one partition of the map from all batches and label the matching
+    partition of the input file with it, in a single pass
     """
-    global file_chunks, chunks_count, args
+    scattered_file, map_partition_files, labelled_file = partition
+    get_proteome_ids = _merge_partition(map_partition_files).get
+    with open(scattered_file, "r") as scattered_fh, open(
+        labelled_file, "w"
+    ) as labelled_fh:
+        advise_sequential(scattered_fh)
+        for block in read_line_blocks(scattered_fh):
+            lines = block.split("\n")
+            lines.pop()  # empty string after the last newline
+            protein_ids = [line[line.rindex("\t") + 1 :] for line in lines]
+            keys = protein_ids if key is None else map(key, protein_ids)
+            labelled_fh.write(
+                "".join(
+                    [
+                        f"{line}\t{label}\n"
+                        for line, label in zip(
+                            lines, map(get_proteome_ids, keys, repeat(nolabel))
+                        )
+                    ]
+                )
+            )
+    delete_files([scattered_file])
+    return labelled_file
+
+
+def _read_numbered_lines(labelled_file):
+    """
+    yield (line_number, line without its number) from a partition labelled by label_partition
+    """
+    with open(labelled_file, "r") as labelled_fh:
+        advise_sequential(labelled_fh)
+        for line in labelled_fh:
+            tab = line.index("\t")
+            yield int(line[:tab]), line[tab + 1 :]
+
+
+def gather_partitions(labelled_files, gathered_file):
+    """
+    Merges the labelled partitions back into the original line order and drops the line numbers.
+    Each partition is already in increasing line number, so a k-way merge is enough, no sorting needed.
+    The result has the three columns cluster_id, protein_id, proteome_ids, as expected by combine_output_chunks.
+
+    Args:
+        labelled_files (list): Paths to the labelled partition files.
+        gathered_file (str): Path to the file that will be created.
+
+    Returns:
+        None
+    """
+    streams = [_read_numbered_lines(labelled_file) for labelled_file in labelled_files]
+    with open(gathered_file, "w") as gathered_fh:
+        out_lines = []
+        for _, line in merge(*streams):
+            out_lines.append(line)
+            if len(out_lines) == 65536:
+                gathered_fh.write("".join(out_lines))
+                out_lines = []
+        gathered_fh.write("".join(out_lines))
+
+
+def initializer(file_chunks_arg, args_arg, workers_counter):
+    """
+    initializer to set global variables for workers;
+    workers_counter is a shared multiprocessing.Value giving each worker its id: 0..threads-1
+    """
+    global file_chunks, chunks_count, args, labelled_files, workerid, protein_key
     file_chunks = file_chunks_arg
     chunks_count = len(file_chunks)
     args = args_arg
+    # resolved once: every batch of this worker uses the same key function
+    protein_key = get_key_function(args)
+    with workers_counter.get_lock():
+        workerid = workers_counter.value
+        workers_counter.value += 1
+    # files this worker has already labelled (nochunks or no locks)
+    labelled_files = set()
 
 
 def worker_process(batch_files):
     """
     process to create a partial dictionary from a batch of files and annotate all file chunks
     """
-    workerid = int(current_process().name.split("-")[1]) - 1  # 0..threads-1
     # eprint(f"   [{workerid}]: reading protein_ids from these files: {batch_files}") #debug
 
     # load partial dictionary for assigned batch of files
@@ -1022,38 +2162,57 @@ def worker_process(batch_files):
         my_file = file_chunks[workerid]  # each worker works on only one (big) file
         # eprint(f"  [{workerid}] processing my_file {my_file}")) #debug
         simply_label(
-            my_file, my_proteome_protein_map, nolabel=args.nolabel, uniq=args.uniq
+            my_file,
+            my_proteome_protein_map,
+            nolabel=args.nolabel,
+            uniq=args.uniq,
+            key=protein_key,
+            already_labelled=my_file in labelled_files,
         )
+        labelled_files.add(my_file)
+    elif not args.locks:
+        # single worker: it is the only writer of every chunk, no need for file locks
+        for file_chunk in file_chunks:
+            simply_label(
+                file_chunk,
+                my_proteome_protein_map,
+                nolabel=args.nolabel,
+                uniq=args.uniq,
+                key=protein_key,
+                already_labelled=file_chunk in labelled_files,
+            )
+            labelled_files.add(file_chunk)
     else:
-        # dictionary to track labeling status for each file chunk
-        chunk_status = {file_chunk: False for file_chunk in file_chunks}
-
-        while not all(chunk_status.values()):  # repeat until all chunks are labelled
-            still_to_label = [
-                chunk for chunk, labeled in chunk_status.items() if not labeled
-            ]
-            for i in sample(range(len(still_to_label)), len(still_to_label)):
-                file_chunk = still_to_label[i]
-                # eprint(f"   [{workerid}]:   now labelling file chunk {file_chunk}") #debug
-                result = lock_and_label(
-                    file_chunk,
-                    my_proteome_protein_map,
-                    nolabel=args.nolabel,
-                    uniq=args.uniq,
-                )
-                if result == 1:
-                    chunk_status[file_chunk] = True
-                    # eprint(f"  [{workerid}] acquired lock on {file_chunk} and labelled") #debug
-                else:
+        # queue of the chunks still to label, in random order to avoid workers fighting for the same file_chunk;
+        # a chunk locked by another worker goes to the back of the queue and the next one is tried:
+        # only when all the remaining chunks have been found locked in a row, the worker waits for a lock
+        still_to_label = deque(sample(file_chunks, chunks_count))
+        busy_in_a_row = 0
+        while still_to_label:  # repeat until all chunks are labelled
+            file_chunk = still_to_label.popleft()
+            wait = busy_in_a_row > len(still_to_label)
+            # eprint(f"   [{workerid}]:   now labelling file chunk {file_chunk}") #debug
+            result = lock_and_label(
+                file_chunk,
+                my_proteome_protein_map,
+                nolabel=args.nolabel,
+                uniq=args.uniq,
+                workerid=workerid,
+                key=protein_key,
+                wait=wait,
+            )
+            if result == 1:
+                busy_in_a_row = 0
+                # eprint(f"  [{workerid}] acquired lock on {file_chunk} and labelled") #debug
+            else:
+                still_to_label.append(file_chunk)
+                if wait:
+                    busy_in_a_row = 0
                     eprint(
-                        f"  [{workerid}] giving up on acquiring lock on {file_chunk}, will retry later. Still to work on: {[chunk for chunk, labeled in chunk_status.items() if not labeled]}"
+                        f"  [{workerid}] giving up on acquiring lock on {file_chunk}, will retry later. Still to work on: {list(still_to_label)}"
                     )  # debug
-
-        # process chunks randomly to avoid workers fighting for the same file_chunk
-        # for i in sample(range(chunks_count), chunks_count):
-        #    file_chunk = file_chunks[i]
-        #    # eprint(f"   [{workerid}]:   now labelling file chunk #{i}") #debug
-        #    lock_and_label(file_chunk, my_proteome_protein_map, nolabel=args.nolabel, uniq=args.uniq)
+                else:
+                    busy_in_a_row += 1
         # eprint(f"   [{workerid}]: labelled {chunks_count} files") #debug
 
     return len(my_proteome_protein_map)
@@ -1069,7 +2228,167 @@ if __name__ == "__main__":
 
     args, fasta_files = check_args(DESCRIPTION)
 
-    if args.distributed:
+    if args.streamed:
+        # ===============
+        # M1: number the lines of the input file and sort them by protein id
+        # ===============
+        start_secs = time.time()
+        eprint(f" |-- ...")
+        sorted_file = args.input_file + "_sorted"
+        lines_count = sort_input_by_protein(
+            args.input_file, sorted_file, threads=args.threads
+        )
+        eprint(
+            " |-- sorted {} lines by protein id {} -- Elapsed: {} --".format(
+                lines_count,
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                elapsed_time(start_secs),
+            )
+        )
+
+        # ===============
+        # M2: write the partial dictionary of each batch sorted by protein id
+        # ===============
+        start_secs = time.time()
+        batches = [
+            fasta_files[i : i + args.batchsize]
+            for i in range(0, len(fasta_files), args.batchsize)
+        ]
+        with Pool(min(args.threads, len(batches))) as pool:
+            results = pool.map(
+                partial(
+                    write_sorted_map, args=args, outprefix=args.input_file + "_map_"
+                ),
+                enumerate(batches),
+            )
+        map_files = [map_file for map_file, _ in results]
+        total_identifiers_processed = sum([ids_count for _, ids_count in results])
+        eprint(
+            " |-- sorted maps written {} -- Elapsed: {}, {} ids/s --".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                *elapsed_time(start_secs, total_identifiers_processed),
+            )
+        )
+        eprint(
+            f" |-- processed {total_identifiers_processed} protein ids from {len(fasta_files)} proteome files in {len(batches)} batches"
+        )
+
+        # ===============
+        # M3: merge maps and input in one pass, restore the order and assign cluster ids
+        # ===============
+        start_secs = time.time()
+        labelled_file = args.input_file + "_labelled"
+        streamed_label(
+            sorted_file,
+            map_files,
+            labelled_file,
+            nolabel=args.nolabel,
+            threads=args.threads,
+        )
+        clusters_count = combine_output_chunks(
+            [labelled_file],
+            args.out_file,
+            sortlabels=args.sortlabels,
+            uniq=args.uniq,
+        )
+        eprint(f" |-- processed {clusters_count} clusters")
+        eprint(
+            " |-- final file created {} -- Elapsed: {}, {} clusters/s --".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                *elapsed_time(start_secs, clusters_count),
+            )
+        )
+
+        # clean up all temporary files
+        delete_files([sorted_file, labelled_file] + map_files)
+    elif args.scatter:
+        # ===============
+        # S1: scatter the input file by protein id, while the batches write their partitioned maps
+        # ===============
+        start_secs = time.time()
+        eprint(f" |-- ...")
+        batches = [
+            fasta_files[i : i + args.batchsize]
+            for i in range(0, len(fasta_files), args.batchsize)
+        ]
+        partitions_count = max(len(batches), args.threads)
+        with Pool(min(args.threads, len(batches))) as pool:
+            batch_results = pool.map_async(
+                partial(
+                    _build_partitioned,
+                    args=args,
+                    partitions_count=partitions_count,
+                    outprefix=args.input_file + "_part_",
+                ),
+                enumerate(batches),
+            )
+            scattered_files, lines_count = scatter_input(
+                args.input_file,
+                partitions_count,
+                args.input_file + "_scattered_",
+                key=get_key_function(args),
+            )
+            batch_partition_files = batch_results.get()
+        eprint(
+            " |-- scattered {} lines in {} partitions {} -- Elapsed: {} --".format(
+                lines_count,
+                partitions_count,
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                elapsed_time(start_secs),
+            )
+        )
+        eprint(
+            f" |-- processed {len(fasta_files)} proteome files in {len(batches)} batches"
+        )
+
+        # ===============
+        # S2: label each partition of the input file with the same partition of the map, in parallel
+        # ===============
+        start_secs = time.time()
+        partitions = zip(
+            scattered_files,
+            zip(*batch_partition_files),
+            [scattered_file + "_labelled" for scattered_file in scattered_files],
+        )
+        with Pool(min(args.threads, partitions_count)) as pool:
+            labelled_files = pool.map(
+                partial(
+                    label_partition,
+                    nolabel=args.nolabel,
+                    key=get_key_function(args),
+                ),
+                partitions,
+            )
+        eprint(
+            " |-- partitions labelled {} -- Elapsed: {}, {} lines/s --".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                *elapsed_time(start_secs, lines_count),
+            )
+        )
+
+        # ===============
+        # S3: restore the original order and assign cluster ids
+        # ===============
+        start_secs = time.time()
+        gathered_file = args.input_file + "_labelled"
+        gather_partitions(labelled_files, gathered_file)
+        clusters_count = combine_output_chunks(
+            [gathered_file],
+            args.out_file,
+            sortlabels=args.sortlabels,
+            uniq=args.uniq,
+        )
+        eprint(f" |-- processed {clusters_count} clusters")
+        eprint(
+            " |-- final file created {} -- Elapsed: {}, {} clusters/s --".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                *elapsed_time(start_secs, clusters_count),
+            )
+        )
+
+        # clean up all temporary files
+        delete_files([gathered_file] + labelled_files)
+    elif args.distributed:
         # ===============
         # P1: setup: assign input file and fasta files among workers in batches
         # ===============
@@ -1093,8 +2412,10 @@ if __name__ == "__main__":
             eprint(f" |-- input file split into {len(output_chunk_paths)} chunks")
 
         # clean up any temporary files leftover from previous executions, if any
-        tmp_files = [filename + "_tmp" for filename in output_chunk_paths] + [
-            filename + ".lock" for filename in output_chunk_paths
+        tmp_files = [
+            filename + suffix
+            for filename in output_chunk_paths
+            for suffix in ("_tmp", ".lock")
         ]
         # eprint(f" |-- deleting tmp files {tmp_files}") #debug
         delete_files(tmp_files)
@@ -1107,6 +2428,8 @@ if __name__ == "__main__":
         eprint(
             f" |-- assigned fasta files in {len(batches)} batches of {args.batchsize} files to {min(args.threads, len(batches))} worker{'s' if min(args.threads, len(batches)) > 1 else ''}"
         )
+        # chunks need locking only if more than one worker can write them at the same time
+        args.locks = min(args.threads, len(batches)) > 1
 
         eprint(
             " |-- workers setup {} -- Elapsed: {} --".format(
@@ -1119,19 +2442,27 @@ if __name__ == "__main__":
         # P2: run worker processes to label all files in a distributed fashion
         # ===============
         start_secs = time.time()
-        processed_ids_counts = []
         with Pool(
-            args.threads, initializer=initializer, initargs=(output_chunk_paths, args)
+            args.threads,
+            initializer=initializer,
+            initargs=(output_chunk_paths, args, Value("i", 0)),
         ) as pool:
+            # one batch per task (chunksize=1): every task reads batchsize fasta files and labels
+            # all the chunks, so sending it costs nothing in comparison, while bigger task chunks
+            # would leave workers idle at the end waiting for the last ones
+            results = pool.imap_unordered(worker_process, batches)
             if args.progress:
-                for processed_ids_count in tqdm(
-                    pool.imap_unordered(worker_process, batches), total=len(batches)
-                ):
-                    processed_ids_counts.append(processed_ids_count)
-
-            else:
-                for processed_ids_count in pool.imap_unordered(worker_process, batches):
-                    processed_ids_counts.append(processed_ids_count)
+                # imported here so runs without --progress do not pay for it
+                from tqdm.auto import tqdm
+
+                results = tqdm(
+                    results,
+                    total=len(batches),
+                    unit="batch",
+                    mininterval=1.0,
+                    smoothing=0.1,
+                )
+            processed_ids_counts = list(results)
 
         total_identifiers_processed = sum(processed_ids_counts)
         eprint(
@@ -1173,11 +2504,11 @@ if __name__ == "__main__":
         )
 
         # clean up all temporary files
-        tmp_files = (
-            output_chunk_paths
-            + [filename + "_tmp" for filename in output_chunk_paths]
-            + [filename + ".lock" for filename in output_chunk_paths]
-        )
+        tmp_files = [
+            filename + suffix
+            for filename in output_chunk_paths
+            for suffix in ("", "_tmp", ".lock")
+        ]
         # eprint(f" |-- deleting tmp files {tmp_files}") #debug
         delete_files(tmp_files)
     else:  # sequential approach
@@ -1186,9 +2517,7 @@ if __name__ == "__main__":
         # ===============
         start_secs = time.time()
         eprint(f" |-- ...")
-        proteome_protein_map = create_proteome_protein_map(
-            fasta_files, args, read_method=READMETHOD
-        )
+        proteome_protein_map = build_map_parallel(fasta_files, args, args.threads)
         eprint(
             f" |-- processed {len(proteome_protein_map)} protein ids from {len(fasta_files)} proteome files"
         )
@@ -1203,14 +2532,24 @@ if __name__ == "__main__":
         # S2: assign proteome labels to protein identifiers
         # ===============
         start_secs = time.time()
-        clusters_count = label_proteins(
-            args.input_file,
-            args.out_file,
-            proteome_protein_map,
-            nolabel=args.nolabel,
-            sortlabels=args.sortlabels,
-            uniq=args.uniq,
-        )
+        if args.awk:
+            clusters_count = label_proteins_awk(
+                args.input_file,
+                args.out_file,
+                proteome_protein_map,
+                args.awk,
+                nolabel=args.nolabel,
+            )
+        else:
+            clusters_count = label_proteins(
+                args.input_file,
+                args.out_file,
+                proteome_protein_map,
+                nolabel=args.nolabel,
+                sortlabels=args.sortlabels,
+                uniq=args.uniq,
+                key=get_key_function(args),
+            )
         eprint(f" |-- processed {clusters_count} clusters")
         eprint(
             " |-- labelling completed -- Elapsed: {}, {} clusters/s --".format(
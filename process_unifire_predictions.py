@@ -1,122 +1,414 @@
 #!/usr/bin/env python
 
 import argparse
+from collections import Counter
 import logging
+import logging.handlers
+import os
+from multiprocessing import Pool
 from pathlib import Path
+import stat
 import sys
-import pandas as pd
 
 PREDICTION_FILES = {
     'arba': 'predictions_arba.out',
     'unirule': 'predictions_unirule.out',
     'pirsr': 'predictions_unirule-pirsr.out',
 }
+BUFFERSIZE = 1048576  # 1Mb
+LOGBUFFER = 1000  # log records written to the log file or console at once
+OUTPUT_EXTENSIONS = {
+    'tsv': 'out',
+    'parquet': 'parquet',
+    'feather': 'feather',
+}
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that keeps the formatted records in memory and writes them in batches of capacity
+    records with a single write call, instead of writing and flushing each record.
+    Batches are made of whole lines, so processes appending to the same log file do not mix their lines.
+    Errors are written at once, with the records before them, so they are not lost if the job is killed.
+    """
+    def __init__(self, filename, capacity: int = LOGBUFFER):
+        super().__init__(filename)
+        self.capacity = capacity
+        self.buffer = []
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.capacity or record.levelno >= logging.ERROR:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(''.join(self.buffer))
+                self.buffer = []
+            super().flush()
+        finally:
+            self.release()
+
+class ListQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that collects the records of a pool worker in a plain list (its queue),
+    to be returned to the parent process with the result and logged there.
+    """
+    def enqueue(self, record):
+        self.queue.append(record)
 
-def setup_logging(loglevel, logfile):
+def setup_logging(loglevel, logfile=None):
     logger = logging.getLogger("proteome_logger")
     logger.setLevel(getattr(logging, loglevel))
     
-    # File handler for missing files
-    fh = logging.FileHandler(logfile) #<-- Use user-specified log file
-    #fh = logging.FileHandler("missing_files_log.txt")
-    #fh.setLevel(logging.WARNING)
-    fh.setLevel(getattr(logging, loglevel))  # <-- Use user-specified log level
-    fh.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    # File handler for missing files (none without logfile: console only)
+    if logfile is not None:
+        fh = BufferedFileHandler(logfile) #<-- Use user-specified log file
+        #fh = logging.FileHandler("missing_files_log.txt")
+        #fh.setLevel(logging.WARNING)
+        fh.setLevel(getattr(logging, loglevel))  # <-- Use user-specified log level
+        fh.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
     
     # Console handler for info/warnings/errors
     ch = logging.StreamHandler()
     #ch.setLevel(getattr(logging, loglevel))
     ch.setLevel(getattr(logging, loglevel))  # <-- Use user-specified log level
     ch.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    # console records are written in batches too; errors are shown at once, with the records before them
+    mh = logging.handlers.MemoryHandler(LOGBUFFER, flushLevel=logging.ERROR, target=ch)
     
     logger.handlers = []  # Clear any existing handlers
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    if logfile is not None:
+        logger.addHandler(fh)
+    logger.addHandler(mh)
     return logger
 
-def process_proteome_dir(proteome_path: Path, force: bool, logger: logging.Logger):
+def read_header(file_path: Path) -> bytes:
+    """
+    Return the header line of a prediction file, without line terminator.
+    """
+    with open(file_path, 'rb') as f:
+        return f.readline().rstrip(b'\r\n')
+
+def append_columns(file_path: Path, out, suffix: bytes):
+    """
+    Copy the data lines of a prediction file (skipping its header) to the open binary file out,
+    appending suffix (the extra tab-separated columns) to every line.
+    The file is processed in blocks of BUFFERSIZE bytes, each made of complete lines.
+    """
+    with open(file_path, 'rb') as f:
+        f.readline()  # header
+        remainder = b''
+        while True:
+            chunk = f.read(BUFFERSIZE)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            cut = chunk.rfind(b'\n') + 1
+            remainder = chunk[cut:]
+            if cut:
+                out.write(add_suffix(chunk[:cut], suffix))
+        if remainder:
+            out.write(add_suffix(remainder + b'\n', suffix))
+
+def add_suffix(block: bytes, suffix: bytes) -> bytes:
+    """
+    Append suffix to every line of a block of complete lines, skipping blank lines (as pandas does).
+    """
+    if b'\r' in block:
+        block = block.replace(b'\r\n', b'\n')
+    while b'\n\n' in block:
+        block = block.replace(b'\n\n', b'\n')
+    block = block.lstrip(b'\n')
+    if not block:
+        return b''
+    return block.replace(b'\n', suffix + b'\n')
+
+def combine_with_pandas(sources: dict, out, proteome_id: str, logger: logging.Logger):
+    """
+    Combine prediction files whose headers differ with pandas, which aligns the columns by name,
+    writing them to the open binary file out.
+    All columns are read as strings, as in combine_with_pyarrow: no type inference, values are copied as they are.
+    Returns False, writing nothing, if none of the files could be read.
+    """
+    import numpy as np
+    import pandas as pd
+
+    dfs = []
+    read_sources = []
+    for source, file_path in sources.items():
+        try:
+            dfs.append(pd.read_csv(file_path, sep='\t', dtype=str, keep_default_na=False, engine='c'))
+            read_sources.append(source)
+        except Exception as e:
+            logger.warning(f"{file_path.parent}: Failed to read {file_path.name}: {e}")
+
+    if not dfs:
+        return False
+    # a single DataFrame (the other files could not be read) needs no concatenation
+    combined_df = dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
+    # constant columns as categoricals: one small code per row instead of a string reference;
+    # source goes right after the columns of the first file, where adding it to each file would put it
+    source_codes = np.repeat(np.arange(len(dfs), dtype=np.int8), [len(df) for df in dfs])
+    combined_df.insert(len(dfs[0].columns), 'source', pd.Categorical.from_codes(source_codes, read_sources))
+    combined_df['proteome_id'] = pd.Categorical.from_codes(np.zeros(len(combined_df), dtype=np.int8), [proteome_id])
+    combined_df.to_csv(out, sep='\t', index=False, encoding='utf-8', lineterminator='\n')
+    return True
+
+def combine_with_pyarrow(sources: dict, headers: dict, out, proteome_id: str, logger: logging.Logger,
+                         output_format: str = 'tsv'):
+    """
+    Combine prediction files with pyarrow, which aligns the columns by name like combine_with_pandas
+    but parses and writes the files in C++ with multiple threads, writing them to the open binary file out
+    as tsv, parquet (zstd compressed) or feather (lz4 compressed).
+    All columns are read as strings, so values are copied as they are.
+    Returns False, writing nothing, if none of the files could be read.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    tables = []
+    for source, file_path in sources.items():
+        try:
+            column_types = {name: pa.string() for name in headers[source].decode().split('\t')}
+            table = pacsv.read_csv(file_path, read_options=pacsv.ReadOptions(use_threads=True, block_size=BUFFERSIZE),
+                                   parse_options=pacsv.ParseOptions(delimiter='\t'),
+                                   convert_options=pacsv.ConvertOptions(column_types=column_types))
+            tables.append(table.append_column('source', pa.array([source] * table.num_rows, pa.string())))
+        except Exception as e:
+            logger.warning(f"{file_path.parent}: Failed to read {file_path.name}: {e}")
+
+    if not tables:
+        return False
+    if len(tables) == 1:  # the other files could not be read
+        combined = tables[0]
+    else:
+        # missing columns are left empty; chunks are only referenced, not copied
+        try:
+            combined = pa.concat_tables(tables, promote_options='default')
+        except TypeError:  # pyarrow < 14
+            combined = pa.concat_tables(tables, promote=True)
+    combined = combined.append_column('proteome_id', pa.array([proteome_id] * combined.num_rows, pa.string()))
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(combined, out, compression='zstd')
+    elif output_format == 'feather':
+        import pyarrow.feather as feather
+        feather.write_feather(combined, out, compression='lz4')
+    else:
+        # values with tabs, quotes or newlines are quoted, like pandas does
+        pacsv.write_csv(combined, out,
+                        write_options=pacsv.WriteOptions(delimiter='\t', quoting_style='needed'))
+    return True
+
+def process_proteome_dir(proteome_path: Path, force: bool, logger: logging.Logger, output_format: str = 'tsv'):
     """
     Combine prediction files in a given proteome directory into a single output file.
     Logs missing files.
+    For tsv output the files are copied as bytes, adding the source and proteome_id columns to each line;
+    pyarrow (or pandas, if pyarrow is not installed) is only used if the files do not all have the same header.
+    Parquet and feather output are always written with pyarrow.
     """
-    dfs = []
+    headers = {}
     missing_files = []
     for source, filename in PREDICTION_FILES.items():
         file_path = proteome_path / filename
-        if file_path.exists():
-            try:
-                df = pd.read_csv(file_path, sep='\t')
-                df['source'] = source
-                dfs.append(df)
-            except Exception as e:
-                logger.warning(f"{proteome_path}: Failed to read {filename}: {e}")
-        else:
+        try:
+            header = read_header(file_path)  # opening the file also tells if it exists
+        except FileNotFoundError:
             missing_files.append(filename)
             logger.warning(f"{proteome_path}: {filename} not found.")
+            continue
+        except Exception as e:
+            logger.warning(f"{proteome_path}: Failed to read {filename}: {e}")
+            continue
+        if not header:
+            logger.warning(f"{proteome_path}: Failed to read {filename}: No columns to parse from file")
+            continue
+        headers[source] = header
 
     if missing_files:
         logger.warning(f"{proteome_path}: Missing files: {' '.join(missing_files)}")
 
-    if not dfs:
+    if not headers:
         logger.info(f"{proteome_path}: No prediction files found, skipping.")
         return
 
-    combined_df = pd.concat(dfs, ignore_index=True)
-    combined_df['proteome_id'] = proteome_path.name
-
-    output_file = proteome_path / f"all_predictions_{proteome_path.name}.out"
-    if output_file.exists() and not force:
-        logger.error(f"{output_file} already exists. Use --force to overwrite.")
-        return
-    elif output_file.exists() and force:
+    output_file = proteome_path / f"all_predictions_{proteome_path.name}.{OUTPUT_EXTENSIONS[output_format]}"
+    out = None
+    try:
+        # exclusive creation: no separate check for an existing file
+        out = open(output_file, 'xb', buffering=BUFFERSIZE)
+    except FileExistsError:
+        if not force:
+            logger.error(f"{output_file} already exists. Use --force to overwrite.")
+            return
         logger.info(f"Overwriting existing file {output_file}")
+    except Exception as e:
+        logger.error(f"Failed to write {output_file}: {e}")
+        return
 
+    created = out is not None
+    sources = {source: proteome_path / PREDICTION_FILES[source] for source in headers}
     try:
-        combined_df.to_csv(output_file, sep='\t', index=False)
+        if out is None:
+            # not truncated yet: an existing file is left as it is if no prediction file can be read
+            out = open(output_file, 'r+b', buffering=BUFFERSIZE)
+        with out:
+            if output_format != 'tsv':
+                written = combine_with_pyarrow(sources, headers, out, proteome_path.name, logger, output_format)
+            elif len(set(headers.values())) > 1:
+                try:
+                    import pyarrow  # noqa: F401
+                except ImportError:
+                    logger.debug(f"{proteome_path}: prediction files have different headers, combining with pandas")
+                    written = combine_with_pandas(sources, out, proteome_path.name, logger)
+                else:
+                    logger.debug(f"{proteome_path}: prediction files have different headers, combining with pyarrow")
+                    written = combine_with_pyarrow(sources, headers, out, proteome_path.name, logger)
+            else:
+                proteome_id = proteome_path.name.encode()
+                out.write(next(iter(headers.values())) + b'\tsource\tproteome_id\n')
+                for source, file_path in sources.items():
+                    append_columns(file_path, out, b'\t' + source.encode() + b'\t' + proteome_id)
+                written = True
+            if written:
+                out.truncate()  # drop what is left of an overwritten longer file
+        if not written:
+            if created:
+                output_file.unlink()
+            logger.info(f"{proteome_path}: No prediction files found, skipping.")
+            return
         logger.info(f"Written: {output_file}")
     except Exception as e:
         logger.error(f"Failed to write {output_file}: {e}")
+        if out is not None:  # do not leave an incomplete file behind
+            output_file.unlink(missing_ok=True)
+
+def init_worker(force: bool, loglevel: int, output_format: str):
+    """
+    Pool initializer: set up the logger of a worker process and store the settings in module globals.
+    The worker logger only collects its records, which are logged by the parent process.
+    The pool already keeps all CPUs busy, so pyarrow (which sizes its thread pool from OMP_NUM_THREADS)
+    is limited to one thread per worker, unless set otherwise.
+    """
+    global worker_force, worker_logger, worker_output_format
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    worker_force = force
+    worker_output_format = output_format
+    worker_logger = logging.getLogger("proteome_logger")
+    worker_logger.setLevel(loglevel)
+    worker_logger.handlers = [ListQueueHandler([])]
+
+def process_proteome_dir_worker(proteome_path: Path) -> list:
+    """
+    Process one proteome directory in a worker process, logging instead of raising unexpected errors.
+    Returns the log records of the directory.
+    """
+    try:
+        process_proteome_dir(proteome_path, worker_force, worker_logger, worker_output_format)
+    except Exception as e:
+        worker_logger.error(f"{proteome_path}: Failed: {e}")
+    handler = worker_logger.handlers[0]
+    records, handler.queue = handler.queue, []
+    return records
+
+def process_proteome_dirs(proteome_dirs: list, force: bool, logger: logging.Logger, threads: int = 1,
+                          output_format: str = 'tsv'):
+    """
+    Process the given proteome directories, in parallel with a pool of worker processes if threads > 1.
+    Workers return their log records with each result and this process logs them,
+    so it is the only writer of the log file and the console.
+    """
+    if threads <= 1 or len(proteome_dirs) <= 1:
+        for proteome_dir in proteome_dirs:
+            process_proteome_dir(proteome_dir, force, logger, output_format)
+        return
+
+    with Pool(min(threads, len(proteome_dirs)), initializer=init_worker,
+              initargs=(force, logger.getEffectiveLevel(), output_format)) as pool:
+        for records in pool.imap_unordered(process_proteome_dir_worker, proteome_dirs, chunksize=16):
+            for record in records:
+                logger.handle(record)
+
+def split_dirs(paths: list):
+    """
+    Split paths into directories and other paths, like Path.is_dir() would.
+    Parents shared by several paths are listed once with os.scandir, whose entries know their type
+    without a stat call per path; other paths are checked with Path.is_dir().
+    Returns the two lists, in the order of paths.
+    """
+    parents_count = Counter(path.parent for path in paths if path.name)
+    listings = {}
+    dirs, others = [], []
+    for path in paths:
+        entries = None
+        if path.name and parents_count[path.parent] > 1:
+            if path.parent not in listings:
+                try:
+                    with os.scandir(path.parent) as it:
+                        listings[path.parent] = {entry.name: entry for entry in it}
+                except OSError:
+                    listings[path.parent] = None
+            entries = listings[path.parent]
+        if entries is None:
+            is_dir = path.is_dir()
+        else:
+            entry = entries.get(path.name)
+            is_dir = entry is not None and entry.is_dir()  # follows symlinks like Path.is_dir()
+        (dirs if is_dir else others).append(path)
+    return dirs, others
 
-def process_input(input_path: Path, force: bool, logger: logging.Logger):
+def process_input(input_path: Path, force: bool, logger: logging.Logger, threads: int = 1,
+                  output_format: str = 'tsv'):
     """
     Detects input type and processes accordingly:
     - Single directory with predictions*out files
     - Directory of subdirectories (each with predictions*out files)
     - File containing list of directories
+    Multiple directories are processed in parallel by threads worker processes.
     """
     processed = 0
     skipped = 0
 
-    if input_path.is_file():
+    try:
+        input_mode = input_path.stat().st_mode  # a single stat for both checks
+    except OSError:
+        input_mode = 0
+
+    if stat.S_ISREG(input_mode):
         # Treat as file containing list of directories
         logger.info(f"Processing list of directories from file: {input_path}")
-        with open(input_path) as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                proteome_dir = Path(line)
-                if proteome_dir.is_dir():
-                    process_proteome_dir(proteome_dir, force, logger)
-                    processed += 1
-                else:
-                    logger.warning(f"{proteome_dir} is not a valid directory, skipping.")
-                    skipped += 1
-    elif input_path.is_dir():
+        # one read, split in C (newlines are already translated to '\n', as when iterating the file)
+        paths = [Path(line) for line in map(str.strip, input_path.read_text().split('\n')) if line]
+        proteome_dirs, not_dirs = split_dirs(paths)
+        for path in not_dirs:
+            logger.warning(f"{path} is not a valid directory, skipping.")
+        processed += len(proteome_dirs)
+        skipped += len(not_dirs)
+        process_proteome_dirs(proteome_dirs, force, logger, threads, output_format)
+    elif stat.S_ISDIR(input_mode):
         # Check for predictions*out files directly in this directory
         has_predictions = any((input_path / fname).exists() for fname in PREDICTION_FILES.values())
         if has_predictions:
             logger.info(f"Processing single proteome directory: {input_path}")
-            process_proteome_dir(input_path, force, logger)
+            process_proteome_dir(input_path, force, logger, output_format)
             processed += 1
         else:
             # Check for subdirectories
-            subdirs = [d for d in input_path.iterdir() if d.is_dir()]
+            with os.scandir(input_path) as it:
+                subdirs = [Path(entry.path) for entry in it if entry.is_dir()]
             if subdirs:
                 logger.info(f"Processing {len(subdirs)} subdirectories in {input_path}")
-                for subdir in subdirs:
-                    process_proteome_dir(subdir, force, logger)
-                    processed += 1
+                process_proteome_dirs(subdirs, force, logger, threads, output_format)
+                processed += len(subdirs)
             else:
                 logger.error(f"No prediction files or subdirectories found in {input_path}. Nothing to do.")
                 skipped += 1
@@ -134,18 +426,32 @@ if __name__ == "__main__":
     parser.add_argument('--input', required=True, help='Path to a proteome directory, a directory of subdirectories, or a file containing directory paths.')
     parser.add_argument('--force', action='store_true', help='Force overwrite of existing output files.')
     parser.add_argument('--log', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help='Set logging level (default: INFO)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only log warnings and errors (same as --log WARNING)')
     parser.add_argument('--logfile', default='missing_files_log.txt', help='Filename for logging output (default: missing_files_log.txt)')
+    parser.add_argument('--threads', type=int, default=len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+                        help='Number of proteome directories to process in parallel (default: number of available CPUs)')
+    parser.add_argument('--format', default='tsv', choices=list(OUTPUT_EXTENSIONS),
+                        help='Output format: tsv (all_predictions_<dir>.out), or parquet/feather, which require pyarrow (default: tsv)')
 
     args = parser.parse_args()
+    if args.quiet and getattr(logging, args.log) < logging.WARNING:
+        args.log = 'WARNING'
+    if args.format != 'tsv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error(f"--format {args.format} requires pyarrow")
     
     input_path = Path(args.input)
+    # console only: a mistyped input path must not create or truncate the log file
+    logger = setup_logging(args.log)
     
     if not input_path.exists():
-        print(f"Error: {input_path} does not exist.")
+        logger.error(f"{input_path} does not exist.")
         sys.exit(1)
 
     logger = setup_logging(args.log, args.logfile)
-    process_input(input_path, args.force, logger)
+    process_input(input_path, args.force, logger, args.threads, args.format)
 
 # Usage
 # Default logging (INFO)
@@ -156,7 +462,14 @@ if __name__ == "__main__":
 
 # Only warnings and errors
 #python script.py --input /path/to/proteome_dir --log WARNING
+#python script.py --input /path/to/proteome_dir --quiet
 
 # Force overwrite
 #python script.py --input /path/to/proteome_dir --force
 
+# Process a directory of proteome directories with 8 worker processes
+#python script.py --input /path/to/proteomes_dir --threads 8
+
+# Write parquet files instead of tsv (requires pyarrow)
+#python script.py --input /path/to/proteomes_dir --format parquet
+
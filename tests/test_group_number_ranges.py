@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import group_number_ranges as gnr
+
+try:
+    import numba  # noqa: F401
+except ImportError:
+    numba = None
+
+# runs in a subprocess: the threading layer and thread count are fixed when numba starts its threads
+PARALLEL_CHECK = """
+import sys
+import numpy as np
+import group_number_ranges as gnr
+
+rng = np.random.default_rng(int(sys.argv[1]))
+# several scan chunks, with breaks at random places (including chunk boundaries)
+a = np.cumsum(rng.integers(1, 3, size=8 * gnr.MINSCANCHUNK + 12345, dtype=np.int64))
+breaks = gnr._numba_find_breaks()(a)
+starts, ends = gnr._find_runs_numpy(a)
+expected = np.flatnonzero(np.diff(a) != 1) + 1
+assert np.array_equal(breaks, expected), "wrong break indices"
+assert np.array_equal(a[np.r_[0, breaks]], starts)
+assert np.array_equal(a[np.r_[breaks - 1, a.size - 1]], ends)
+"""
+
+
+@unittest.skipIf(numba is None, "numba is not installed")
+class TestParallelFindBreaks(unittest.TestCase):
+    def check_layer(self, layer):
+        env = dict(os.environ, NUMBA_THREADING_LAYER=layer, NUMBA_NUM_THREADS="8")
+        for seed in range(5):
+            result = subprocess.run(
+                [sys.executable, "-c", PARALLEL_CHECK, str(seed)],
+                cwd=os.path.dirname(gnr.__file__),
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if "No threading layer could be loaded" in result.stderr:
+                self.skipTest(f"numba threading layer {layer} is not available")
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_workqueue(self):
+        self.check_layer("workqueue")
+
+    def test_omp(self):
+        self.check_layer("omp")
+
+    def test_tbb(self):
+        self.check_layer("tbb")
+
+
+if __name__ == "__main__":
+    unittest.main()
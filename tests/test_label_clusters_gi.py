@@ -0,0 +1,206 @@
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import label_clusters_gi as lc
+
+SCRIPT = os.path.join(ROOT, "label_clusters_gi.py")
+READ_METHODS = ["grep", "scan", "prefetch", "lines", "full"]
+
+
+def make_dataset(directory):
+    """
+    Write 6 proteome fasta files sharing some protein ids and a clusters file to `directory`.
+    proteome_3 has CRLF line endings, proteome_5 no final newline, proteome_6 a NUL byte in a sequence.
+    """
+    rng = random.Random(0)
+    fasta_dir = os.path.join(directory, "fasta")
+    os.mkdir(fasta_dir)
+    proteins = [f"P{i:04d}" for i in range(80)]
+    for n in range(1, 7):
+        newline = "\r\n" if n == 3 else "\n"
+        text = "".join(
+            f">{protein}{' desc ' + str(k) if k % 3 == 0 else ''}{newline}ACGT{newline}GG{newline}"
+            for k, protein in enumerate(rng.sample(proteins, 30))
+        )
+        if n == 5:
+            text = text.rstrip("\n")
+        if n == 6:
+            text = text.replace("ACGT", "AC\0GT", 1)
+        with open(os.path.join(fasta_dir, f"proteome_{n}.fa"), "w", newline="") as fh:
+            fh.write(text)
+
+    lines = []
+    for cluster in range(25):
+        # proteins not found in any proteome and repeated lines (for --uniq) included
+        for protein in rng.sample(proteins + ["Q0001", "Q0002"], rng.randint(1, 6)):
+            lines.append(f"C{cluster:03d}\t{protein}\n")
+            if rng.random() < 0.1:
+                lines.append(f"C{cluster:03d}\t{protein}\n")
+    input_file = os.path.join(directory, "in.tsv")
+    with open(input_file, "w") as fh:
+        fh.write("".join(lines))
+    return fasta_dir, input_file
+
+
+class TestReadMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.fasta_dir, _ = make_dataset(cls.tmpdir)
+        cls.fasta_files = lc.list_fasta_files(cls.fasta_dir, "proteome_", ".fa")
+        cls.args = argparse.Namespace(prefix="proteome_", extension=".fa", hash_keys=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_same_map(self):
+        # 'full' reads the files in text mode, like the original line by line implementation
+        expected = lc.create_proteome_protein_map(self.fasta_files, self.args, read_method="full")
+        self.assertFalse([protein_id for protein_id in expected if protein_id.endswith("\r")])
+        for read_method in READ_METHODS:
+            with self.subTest(read_method=read_method):
+                proteome_protein_map = lc.create_proteome_protein_map(
+                    self.fasta_files, self.args, read_method=read_method
+                )
+                self.assertEqual(proteome_protein_map, expected)
+
+    def test_crlf_headers(self):
+        crlf_file = os.path.join(self.fasta_dir, "proteome_3.fa")
+        with open(crlf_file) as fh:
+            expected = [line[1:].split()[0] for line in fh if line.startswith(">")]
+        self.assertEqual(list(lc.scan_fasta_headers(crlf_file)), expected)
+        self.assertEqual([protein_id for _, protein_id in lc.grep_fasta_headers([crlf_file])], expected)
+
+    def test_grep_nul_bytes(self):
+        nul_file = os.path.join(self.fasta_dir, "proteome_6.fa")
+        self.assertEqual(
+            [protein_id for _, protein_id in lc.grep_fasta_headers([nul_file])],
+            list(lc.scan_fasta_headers(nul_file)),
+        )
+
+
+class TestFileLocks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.chunk = os.path.join(self.tmpdir, "chunk")
+        with open(self.chunk, "w") as fh:
+            fh.write("C1\tP1\nC1\tP2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_acquire_taken_lock(self):
+        fd = lc.acquire_flock(self.chunk + ".lock")
+        try:
+            with self.assertRaises(TimeoutError):
+                lc.acquire_flock(self.chunk + ".lock")
+            with self.assertRaises(TimeoutError):
+                lc.acquire_flock(self.chunk + ".lock", timeout=0.1)
+        finally:
+            lc.release_flock(fd)
+        lc.release_flock(lc.acquire_flock(self.chunk + ".lock", timeout=0.1))
+
+    def test_lock_and_label(self):
+        fd = lc.acquire_flock(self.chunk + ".lock")
+        try:
+            self.assertEqual(lc.lock_and_label(self.chunk, {"P1": "A"}, wait=False), 0)
+        finally:
+            lc.release_flock(fd)
+        with open(self.chunk) as fh:
+            self.assertEqual(fh.read(), "C1\tP1\nC1\tP2\n")
+
+        self.assertEqual(lc.lock_and_label(self.chunk, {"P1": "A"}, wait=False), 1)
+        self.assertEqual(lc.lock_and_label(self.chunk, {"P2": "B"}), 1)
+        with open(self.chunk) as fh:
+            self.assertEqual(fh.read(), "C1\tP1\tA\nC1\tP2\tB\n")
+
+
+class TestLabellingModes(unittest.TestCase):
+    """
+    Every labelling mode must write the same output file as the default (sequential) approach.
+    """
+
+    MODES = {
+        "threads": ["-t", "2"],
+        "awk": ["-a"],
+        "hash-keys": ["-k"],
+        "distributed": ["-b", "2", "-t", "2"],
+        "distributed small chunks": ["-b", "2", "-t", "2", "-c", "1k"],
+        "distributed nochunks": ["-b", "2", "-t", "2", "-c", "n"],
+        "streamed": ["-b", "2", "-t", "2", "-m"],
+        "scatter": ["-b", "2", "-t", "2", "-x"],
+        "scatter hash-keys": ["-b", "2", "-t", "2", "-x", "-k"],
+    }
+    # modes relabelling the input file for every batch add a nolabel placeholder per batch
+    RELABELLING = {"distributed", "distributed small chunks", "distributed nochunks"}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.fasta_dir, cls.input_file = make_dataset(cls.tmpdir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def label(self, name, options):
+        out_file = os.path.join(self.tmpdir, name.replace(" ", "_") + "_".join(options))
+        result = subprocess.run(
+            [sys.executable, SCRIPT, "-f", self.fasta_dir, "-i", self.input_file, "-o", out_file,
+             "-p", "proteome_", "-e", ".fa"] + options,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(out_file) as fh:
+            output = fh.read()
+        os.remove(out_file)
+        return output
+
+    def check_modes(self, options):
+        expected = self.label("default", options)
+        for name, mode_options in self.MODES.items():
+            if name == "awk" and (options or shutil.which("awk") is None):
+                continue  # awk only labels without --sortlabels and --uniq
+            with self.subTest(mode=name):
+                self.assertEqual(self.label(name, mode_options + options), expected)
+
+    def test_default(self):
+        self.check_modes([])
+        # proteins of the CRLF and unterminated fasta files are labelled
+        labels = {line.split("\t")[2] for line in self.label("default", []).splitlines()[1:]}
+        self.assertTrue(any("3" in label.split(",") for label in labels))
+        self.assertTrue(any("5" in label.split(",") for label in labels))
+
+    def test_sortlabels(self):
+        self.check_modes(["-s"])
+
+    def test_uniq(self):
+        self.check_modes(["-u"])
+
+    def test_sortlabels_uniq(self):
+        self.check_modes(["-s", "-u"])
+
+    def test_nolabel(self):
+        expected = self.label("default", ["-n", "?"])
+        relabelled = self.label("distributed", ["-b", "2", "-n", "?"])
+        for name, mode_options in self.MODES.items():
+            if name == "awk" and shutil.which("awk") is None:
+                continue
+            with self.subTest(mode=name):
+                output = self.label(name, mode_options + ["-n", "?"])
+                self.assertEqual(output, relabelled if name in self.RELABELLING else expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
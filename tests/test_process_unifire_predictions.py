@@ -0,0 +1,113 @@
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import process_unifire_predictions as pu
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+class TestProcessProteomeDir(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.proteome = Path(self.tmpdir) / "UP000001"
+        self.proteome.mkdir()
+        self.output_file = self.proteome / "all_predictions_UP000001.out"
+        self.logger = logging.getLogger("test_process_unifire_predictions")
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, source, text):
+        (self.proteome / pu.PREDICTION_FILES[source]).write_bytes(text)
+
+    def process(self, force=False):
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            pu.process_proteome_dir(self.proteome, force, self.logger)
+        return logs.output
+
+    def test_matching_headers(self):
+        self.write('arba', b'id\trule\nQ1\tARBA1\nQ2\tARBA2\n')
+        # CRLF, blank lines and no final newline are written like pandas did
+        self.write('unirule', b'id\trule\r\nQ3\tUR1\r\n\r\nQ4\tUR2')
+        self.write('pirsr', b'id\trule\n')
+        logs = self.process()
+        self.assertEqual(
+            self.output_file.read_bytes(),
+            b'id\trule\tsource\tproteome_id\n'
+            b'Q1\tARBA1\tarba\tUP000001\n'
+            b'Q2\tARBA2\tarba\tUP000001\n'
+            b'Q3\tUR1\tunirule\tUP000001\n'
+            b'Q4\tUR2\tunirule\tUP000001\n',
+        )
+        self.assertIn(f"INFO:{self.logger.name}:Written: {self.output_file}", logs)
+
+    def test_differing_headers(self):
+        self.write('arba', b'id\trule\nQ1\tARBA1\n')
+        self.write('unirule', b'id\tevidence\nQ2\t2\n')
+        logs = self.process()
+        self.assertEqual(
+            self.output_file.read_bytes(),
+            b'id\trule\tsource\tevidence\tproteome_id\n'
+            b'Q1\tARBA1\tarba\t\tUP000001\n'
+            b'Q2\t\tunirule\t2\tUP000001\n',
+        )
+        self.assertIn(f"WARNING:{self.logger.name}:{self.proteome}: Missing files: "
+                      f"{pu.PREDICTION_FILES['pirsr']}", logs)
+
+    def test_all_files_unreadable(self):
+        # the headers differ, so the files are parsed, and every parse fails
+        self.write('arba', b'id\trule\nQ1\tARBA1\nQ2\tARBA2\textra\tfields\n')
+        self.write('unirule', b'id\tevidence\nQ3\t2\nQ4\t2\textra\tfields\n')
+        logs = self.process()
+        self.assertFalse(self.output_file.exists())
+        self.assertIn(f"INFO:{self.logger.name}:{self.proteome}: No prediction files found, skipping.", logs)
+
+        # an existing output is left as it is, even with force
+        self.output_file.write_bytes(b'previous output\n')
+        self.process(force=True)
+        self.assertEqual(self.output_file.read_bytes(), b'previous output\n')
+
+    def test_existing_output(self):
+        self.write('arba', b'id\trule\nQ1\tARBA1\n')
+        self.output_file.write_bytes(b'previous output, longer than the new one\n' * 10)
+        logs = self.process()
+        self.assertIn(f"ERROR:{self.logger.name}:{self.output_file} already exists. Use --force to overwrite.", logs)
+        self.process(force=True)
+        self.assertEqual(self.output_file.read_bytes(),
+                         b'id\trule\tsource\tproteome_id\nQ1\tARBA1\tarba\tUP000001\n')
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestCombineWithPyarrow(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.logger = logging.getLogger("test_process_unifire_predictions")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_as_pandas(self):
+        sources = {'arba': self.tmpdir / 'arba.out', 'unirule': self.tmpdir / 'unirule.out'}
+        sources['arba'].write_bytes(b'id\trule\nQ1\tARBA1\nQ2\t"quoted"\n')
+        sources['unirule'].write_bytes(b'id\tevidence\nQ3\t2\n')
+        headers = {source: pu.read_header(path) for source, path in sources.items()}
+        with_pandas, with_pyarrow = io.BytesIO(), io.BytesIO()
+        self.assertTrue(pu.combine_with_pandas(sources, with_pandas, 'UP000001', self.logger))
+        self.assertTrue(pu.combine_with_pyarrow(sources, headers, with_pyarrow, 'UP000001', self.logger))
+        self.assertEqual(with_pyarrow.getvalue(), with_pandas.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()